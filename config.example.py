@@ -7,6 +7,7 @@ load_dotenv()
 # Supabase
 SUPABASE_URL = os.getenv("SUPABASE_URL", "https://your-project.supabase.co")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY", "your-anon-key")
+SUPABASE_DB_URL = os.getenv("SUPABASE_DB_URL", "")  # Optional: direct Postgres URI for bulk imports
 
 # Gemini AI
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "your-gemini-key")
@@ -7,6 +7,7 @@ load_dotenv()
 # Supabase
 SUPABASE_URL = os.getenv("SUPABASE_URL", "")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY", "")
+SUPABASE_DB_URL = os.getenv("SUPABASE_DB_URL", "")
 
 # Gemini AI
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
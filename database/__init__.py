@@ -2,35 +2,53 @@
 from .supabase_client import (
     get_supabase_client,
     save_glucose_readings,
+    save_glucose_readings_bulk,
     get_glucose_readings,
+    get_glucose_readings_df,
     save_food_logs,
     get_food_logs,
+    get_food_logs_df,
+    get_table_fingerprint,
     save_crash_events,
     get_crash_events,
+    detect_crashes_in_db,
+    has_detect_crashes_function,
     save_chat_message,
     get_chat_history,
     get_meal_ai_assessment,
     save_meal_ai_assessment,
     get_all_meal_ai_assessments,
+    get_meal_ai_assessment_keys,
     is_file_already_imported,
     record_imported_file,
+    filter_unimported,
+    record_imported_files,
     get_recently_imported_files,
 )
 
 __all__ = [
     "get_supabase_client",
     "save_glucose_readings",
+    "save_glucose_readings_bulk",
     "get_glucose_readings",
+    "get_glucose_readings_df",
     "save_food_logs",
     "get_food_logs",
+    "get_food_logs_df",
+    "get_table_fingerprint",
     "save_crash_events",
     "get_crash_events",
+    "detect_crashes_in_db",
+    "has_detect_crashes_function",
     "save_chat_message",
     "get_chat_history",
     "get_meal_ai_assessment",
     "save_meal_ai_assessment",
     "get_all_meal_ai_assessments",
+    "get_meal_ai_assessment_keys",
     "is_file_already_imported",
     "record_imported_file",
+    "filter_unimported",
+    "record_imported_files",
     "get_recently_imported_files",
 ]
@@ -140,3 +140,110 @@ CREATE POLICY "Allow all operations on chat_history" ON chat_history FOR ALL USI
 CREATE POLICY "Allow all operations on user_symptoms" ON user_symptoms FOR ALL USING (true) WITH CHECK (true);
 CREATE POLICY "Allow all operations on meal_ai_assessments" ON meal_ai_assessments FOR ALL USING (true) WITH CHECK (true);
 CREATE POLICY "Allow all operations on imported_files" ON imported_files FOR ALL USING (true) WITH CHECK (true);
+
+-- ============================================================================
+-- Functions
+-- ============================================================================
+
+-- Server-side crash detection from raw glucose readings
+-- (mirrors calculate_glucose_velocity + detect_crash_events in utils/crash_analysis.py)
+CREATE OR REPLACE FUNCTION detect_crashes(
+    range_start TIMESTAMPTZ DEFAULT NULL,
+    range_end TIMESTAMPTZ DEFAULT NULL,
+    threshold NUMERIC DEFAULT 2.0
+)
+RETURNS TABLE (
+    start_time TIMESTAMPTZ,
+    end_time TIMESTAMPTZ,
+    start_glucose NUMERIC,
+    end_glucose NUMERIC,
+    drop_magnitude NUMERIC,
+    average_velocity NUMERIC,
+    max_velocity NUMERIC,
+    duration_minutes NUMERIC
+)
+LANGUAGE sql
+STABLE
+SET search_path = public
+AS $$
+    -- Only the readings a crash starting in the range can depend on, so a ranged call
+    -- doesn't scan the whole table. Look back three readings before range_start: a
+    -- reading's velocity needs the one before it, its smoothed velocity the velocity
+    -- before that, and its run start the danger flag of the reading before it. Look
+    -- ahead 6 hours past range_end, so a crash that starts in the range keeps its
+    -- full length (at the default 2 mg/dL/min, 6 hours would be a 720 mg/dL drop)
+    WITH readings AS (
+        SELECT g.timestamp, g.glucose_mg_dl
+        FROM glucose_readings g
+        WHERE (range_start IS NULL OR g.timestamp >= COALESCE(
+                  (SELECT MIN(p.timestamp) FROM (
+                      SELECT timestamp FROM glucose_readings
+                      WHERE timestamp < range_start
+                      ORDER BY timestamp DESC
+                      LIMIT 3
+                  ) p),
+                  range_start))
+          AND (range_end IS NULL OR g.timestamp <= range_end + INTERVAL '6 hours')
+    ),
+    -- Velocity in mg/dL per minute between consecutive readings
+    velocity AS (
+        SELECT
+            r.timestamp,
+            r.glucose_mg_dl,
+            (r.glucose_mg_dl - LAG(r.glucose_mg_dl) OVER w)
+                / NULLIF(EXTRACT(EPOCH FROM r.timestamp - LAG(r.timestamp) OVER w) / 60, 0) AS velocity
+        FROM readings r
+        WINDOW w AS (ORDER BY r.timestamp)
+    ),
+    -- Centered 3-reading rolling mean (15 min at ~5 min intervals), NULLs skipped
+    smoothed AS (
+        SELECT
+            timestamp,
+            glucose_mg_dl,
+            AVG(velocity) OVER (ORDER BY timestamp ROWS BETWEEN 1 PRECEDING AND 1 FOLLOWING) AS velocity_smoothed
+        FROM velocity
+    ),
+    flagged AS (
+        SELECT
+            *,
+            COALESCE(velocity_smoothed <= -threshold, FALSE) AS is_danger_zone
+        FROM smoothed
+    ),
+    -- Number each run of consecutive danger-zone readings
+    runs AS (
+        SELECT
+            *,
+            SUM(CASE WHEN is_danger_zone AND NOT COALESCE(prev_danger, FALSE) THEN 1 ELSE 0 END)
+                OVER (ORDER BY timestamp) AS run_id
+        FROM (
+            SELECT *, LAG(is_danger_zone) OVER (ORDER BY timestamp) AS prev_danger
+            FROM flagged
+        ) f
+    ),
+    crashes AS (
+        SELECT
+            MIN(timestamp) AS start_time,
+            MAX(timestamp) AS end_time,
+            (ARRAY_AGG(glucose_mg_dl ORDER BY timestamp))[1] AS start_glucose,
+            (ARRAY_AGG(glucose_mg_dl ORDER BY timestamp DESC))[1] AS end_glucose,
+            AVG(velocity_smoothed) AS average_velocity,
+            MIN(velocity_smoothed) AS max_velocity  -- Most negative
+        FROM runs
+        WHERE is_danger_zone
+        GROUP BY run_id
+        HAVING COUNT(*) >= 2
+    )
+    SELECT
+        start_time,
+        end_time,
+        start_glucose,
+        end_glucose,
+        start_glucose - end_glucose AS drop_magnitude,
+        average_velocity,
+        max_velocity,
+        EXTRACT(EPOCH FROM end_time - start_time) / 60 AS duration_minutes
+    FROM crashes
+    WHERE (range_start IS NULL OR start_time >= range_start)
+      AND (range_end IS NULL OR start_time <= range_end)
+    ORDER BY start_time;
+$$;
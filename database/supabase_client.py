@@ -1,26 +1,156 @@
 """Supabase client initialization and database operations."""
-from supabase import create_client, Client
-from config import SUPABASE_URL, SUPABASE_KEY
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import httpx
+import orjson
+import pandas as pd
+import pyarrow as pa
+from supabase import create_client, Client, ClientOptions
+from config import SUPABASE_URL, SUPABASE_KEY, SUPABASE_DB_URL, DANGER_ZONE_THRESHOLD
 
+# Max rows per upsert request; larger payloads risk timeouts and request size limits
+UPSERT_CHUNK = 1000
+# PostgREST caps responses at 1000 rows by default, so unbounded reads are paged
+PAGE_SIZE = 1000
+# Concurrent page requests per read; stays well under the pool's max_connections
+PAGE_WORKERS = 4
+# Glucose uploads larger than this go through COPY when SUPABASE_DB_URL is set
+BULK_COPY_THRESHOLD = 5000
+GLUCOSE_COPY_COLS = ("timestamp", "glucose_mg_dl", "velocity", "velocity_smoothed", "is_danger_zone")
 
+# Successful writes per table in this process. Part of get_table_fingerprint, since an
+# upsert that corrects values at existing timestamps leaves the row count and latest
+# timestamp unchanged
+_table_writes: dict[str, int] = {}
+
+
+class _OrjsonHttpxClient(httpx.Client):
+    """httpx client that encodes JSON request bodies with orjson instead of the stdlib encoder."""
+
+    def request(self, method, url, *, json=None, headers=None, **kwargs):
+        if json is not None:
+            # orjson handles numpy scalars natively and writes NaN as null
+            headers = httpx.Headers(headers)
+            headers["Content-Type"] = "application/json"
+            kwargs["content"] = orjson.dumps(json, option=orjson.OPT_SERIALIZE_NUMPY)
+        return super().request(method, url, headers=headers, **kwargs)
+
+
+@lru_cache(maxsize=1)
 def get_supabase_client() -> Client | None:
-    """Get Supabase client instance."""
+    """Get the shared Supabase client instance (created once per process)."""
     if not SUPABASE_URL or not SUPABASE_KEY:
         return None
-    return create_client(SUPABASE_URL, SUPABASE_KEY)
+    # One pooled keep-alive transport shared by every table request, so chunked
+    # upserts reuse the TLS connection; retries cover dropped connections only.
+    # HTTP/2 (h2 ships with postgrest's httpx[http2]) multiplexes the concurrent
+    # page reads and parallel saves over that one connection
+    transport = httpx.HTTPTransport(
+        http2=True,
+        retries=2,
+        limits=httpx.Limits(max_keepalive_connections=10, max_connections=20, keepalive_expiry=30.0),
+    )
+    options = ClientOptions(httpx_client=_OrjsonHttpxClient(timeout=120, transport=transport))
+    return create_client(SUPABASE_URL, SUPABASE_KEY, options=options)
+
+
+def _upsert_in_chunks(client: Client, table: str, rows: list[dict], on_conflict: str) -> bool:
+    """Upsert rows in UPSERT_CHUNK-sized batches. Returns True only if every batch succeeded."""
+    batch_ok = []
+    for i in range(0, len(rows), UPSERT_CHUNK):
+        batch = rows[i:i + UPSERT_CHUNK]
+        try:
+            client.table(table).upsert(batch, on_conflict=on_conflict).execute()
+            _table_writes[table] = _table_writes.get(table, 0) + 1
+            batch_ok.append(True)
+        except Exception as e:
+            # Keep going so one bad batch doesn't drop the rest of the upload
+            print(f"Error saving {table} (rows {i}-{i + len(batch) - 1}): {e}")
+            batch_ok.append(False)
+    return all(batch_ok)
+
+
+def _fetch_all_pages(build_query) -> list[dict]:
+    """
+    Fetch every row of a select query in PAGE_SIZE pages.
+
+    build_query(count=None) must return a fresh, deterministically ordered select.
+    The first page also asks for the exact row count, so the remaining pages are
+    requested concurrently instead of one after another.
+    """
+    first = build_query(count="exact").range(0, PAGE_SIZE - 1).execute()
+    rows = first.data
+    total = first.count if first.count is not None else len(rows)
+    offsets = range(PAGE_SIZE, total, PAGE_SIZE)
+    if offsets:
+        with ThreadPoolExecutor(max_workers=PAGE_WORKERS) as ex:
+            pages = ex.map(lambda offset: build_query().range(offset, offset + PAGE_SIZE - 1).execute().data, offsets)
+            for page in pages:
+                rows.extend(page)
+    return rows
+
+
+def _records_to_df(records: list[dict]) -> pd.DataFrame:
+    """Build a DataFrame from PostgREST rows via Arrow's columnar builder and parse the timestamp column."""
+    if not records:
+        return pd.DataFrame()
+    df = pa.Table.from_pylist(records).to_pandas()
+    if 'timestamp' in df.columns:
+        df['timestamp'] = pd.to_datetime(df['timestamp'])
+    return df
 
 
 # Database operations for glucose readings
 def save_glucose_readings(readings: list[dict]) -> bool:
     """Save glucose readings to Supabase."""
+    if SUPABASE_DB_URL and len(readings) > BULK_COPY_THRESHOLD:
+        return save_glucose_readings_bulk(readings)
     client = get_supabase_client()
     if not client:
         return False
+    return _upsert_in_chunks(client, "glucose_readings", readings, on_conflict="timestamp")
+
+
+def save_glucose_readings_bulk(readings: list[dict]) -> bool:
+    """Save glucose readings over a direct Postgres connection with COPY, upserting on timestamp.
+
+    Falls back to the REST upsert when SUPABASE_DB_URL is unset or psycopg isn't installed.
+    """
+    try:
+        import psycopg
+    except ImportError:
+        psycopg = None
+    if not SUPABASE_DB_URL or psycopg is None:
+        client = get_supabase_client()
+        if not client:
+            return False
+        return _upsert_in_chunks(client, "glucose_readings", readings, on_conflict="timestamp")
+
+    cols = ", ".join(GLUCOSE_COPY_COLS)
     try:
-        client.table("glucose_readings").upsert(readings, on_conflict="timestamp").execute()
+        with psycopg.connect(SUPABASE_DB_URL) as conn, conn.cursor() as cur:
+            # COPY can't upsert, so stage the rows and merge them in one statement
+            cur.execute(
+                "CREATE TEMP TABLE glucose_staging ("
+                "timestamp TIMESTAMPTZ, glucose_mg_dl NUMERIC, velocity NUMERIC, "
+                "velocity_smoothed NUMERIC, is_danger_zone BOOLEAN) ON COMMIT DROP"
+            )
+            # Render every row as one CSV block in pandas' C writer instead of a write_row
+            # call per reading; NaN/None become empty fields, which COPY csv loads as NULL
+            # (the REST path writes null too, rather than numeric NaN)
+            rows_csv = pd.DataFrame(readings).reindex(columns=list(GLUCOSE_COPY_COLS)).to_csv(index=False, header=False)
+            with cur.copy(f"COPY glucose_staging ({cols}) FROM STDIN WITH (FORMAT csv)") as copy:
+                copy.write(rows_csv)
+            cur.execute(
+                f"INSERT INTO glucose_readings ({cols}) SELECT {cols} FROM glucose_staging "
+                "ON CONFLICT (timestamp) DO UPDATE SET "
+                "glucose_mg_dl = EXCLUDED.glucose_mg_dl, velocity = EXCLUDED.velocity, "
+                "velocity_smoothed = EXCLUDED.velocity_smoothed, is_danger_zone = EXCLUDED.is_danger_zone"
+            )
+        _table_writes["glucose_readings"] = _table_writes.get("glucose_readings", 0) + 1
         return True
     except Exception as e:
-        print(f"Error saving glucose readings: {e}")
+        print(f"Error bulk saving glucose readings: {e}")
         return False
 
 
@@ -30,35 +160,44 @@ def get_glucose_readings(start_date: str = None, end_date: str = None) -> list[d
     if not client:
         return []
     try:
-        query = client.table("glucose_readings").select("*")
-        if start_date:
-            query = query.gte("timestamp", start_date)
-        if end_date:
-            query = query.lte("timestamp", end_date)
-        result = query.order("timestamp").execute()
-        return result.data
+        def build_query(count=None):
+            query = client.table("glucose_readings").select("*", count=count)
+            if start_date:
+                query = query.gte("timestamp", start_date)
+            if end_date:
+                query = query.lte("timestamp", end_date)
+            return query.order("timestamp")
+
+        return _fetch_all_pages(build_query)
     except Exception as e:
         print(f"Error fetching glucose readings: {e}")
         return []
 
 
+def get_glucose_readings_df(start_date: str = None, end_date: str = None) -> pd.DataFrame:
+    """Fetch glucose readings from Supabase as a DataFrame with parsed timestamps."""
+    return _records_to_df(get_glucose_readings(start_date, end_date))
+
+
 # Database operations for food logs
-def save_food_logs(logs: list[dict]) -> bool:
-    """Save food logs to Supabase."""
+def save_food_logs(logs: list[dict] | pd.DataFrame) -> bool:
+    """
+    Save food logs to Supabase.
+
+    Accepts records or a DataFrame already shaped to the food_logs columns;
+    passing the DataFrame skips a records -> DataFrame round-trip.
+    """
     client = get_supabase_client()
     if not client:
         return False
     try:
-        # Deduplicate by timestamp + food_name (keep first occurrence)
-        seen = set()
-        unique_logs = []
-        for log in logs:
-            key = (log.get('timestamp'), log.get('food_name'))
-            if key not in seen:
-                seen.add(key)
-                unique_logs.append(log)
-        client.table("food_logs").upsert(unique_logs, on_conflict="timestamp,food_name").execute()
-        return True
+        # Deduplicate by timestamp + food_name (keep first occurrence) - a single
+        # upsert can't touch the same row twice
+        logs_df = logs if isinstance(logs, pd.DataFrame) else pd.DataFrame(logs)
+        if not logs_df.empty:
+            logs_df = logs_df.drop_duplicates(subset=['timestamp', 'food_name'], keep='first')
+        unique_logs = logs_df.to_dict('records')
+        return _upsert_in_chunks(client, "food_logs", unique_logs, on_conflict="timestamp,food_name")
     except Exception as e:
         print(f"Error saving food logs: {e}")
         return False
@@ -70,47 +209,132 @@ def get_food_logs(start_date: str = None, end_date: str = None) -> list[dict]:
     if not client:
         return []
     try:
-        query = client.table("food_logs").select("*")
-        if start_date:
-            query = query.gte("timestamp", start_date)
-        if end_date:
-            query = query.lte("timestamp", end_date)
-        result = query.order("timestamp").execute()
-        return result.data
+        def build_query(count=None):
+            query = client.table("food_logs").select("*", count=count)
+            if start_date:
+                query = query.gte("timestamp", start_date)
+            if end_date:
+                query = query.lte("timestamp", end_date)
+            # Order by the full unique key so pages don't overlap or skip rows
+            return query.order("timestamp").order("food_name")
+
+        return _fetch_all_pages(build_query)
     except Exception as e:
         print(f"Error fetching food logs: {e}")
         return []
 
 
+def get_food_logs_df(start_date: str = None, end_date: str = None) -> pd.DataFrame:
+    """Fetch food logs from Supabase as a DataFrame with parsed timestamps."""
+    return _records_to_df(get_food_logs(start_date, end_date))
+
+
+def get_table_fingerprint(table: str, time_column: str = "timestamp") -> tuple:
+    """
+    Cheap change marker for a table: its row count, latest timestamp and the
+    number of writes this process has made to it.
+
+    Lets callers key caches on a table's contents without fetching its rows.
+    """
+    writes = _table_writes.get(table, 0)
+    client = get_supabase_client()
+    if not client:
+        return (0, None, writes)
+    try:
+        response = (
+            client.table(table)
+            .select(time_column, count="exact")
+            .order(time_column, desc=True)
+            .limit(1)
+            .execute()
+        )
+        latest = response.data[0][time_column] if response.data else None
+        return (response.count or 0, latest, writes)
+    except Exception as e:
+        print(f"Error fetching {table} fingerprint: {e}")
+        return (0, None, writes)
+
+
 # Database operations for crash events
 def save_crash_events(events: list[dict]) -> bool:
     """Save crash events to Supabase."""
     client = get_supabase_client()
+    if not client:
+        return False
+    return _upsert_in_chunks(client, "crash_events", events, on_conflict="start_time,end_time")
+
+
+def get_crash_events(start_date: str = None, end_date: str = None) -> list[dict]:
+    """Fetch crash events from Supabase."""
+    client = get_supabase_client()
+    if not client:
+        return []
+    try:
+        def build_query(count=None):
+            query = client.table("crash_events").select("*", count=count)
+            if start_date:
+                query = query.gte("start_time", start_date)
+            if end_date:
+                query = query.lte("start_time", end_date)
+            # Order by the full unique key so pages don't overlap or skip rows
+            return query.order("start_time").order("end_time")
+
+        return _fetch_all_pages(build_query)
+    except Exception as e:
+        print(f"Error fetching crash events: {e}")
+        return []
+
+
+# Set once the detect_crashes probe succeeds; a failed probe is retried on the next call
+_detect_crashes_available = False
+
+
+def has_detect_crashes_function() -> bool:
+    """
+    Check whether the detect_crashes function is deployed.
+
+    When it is, crashes are derived from glucose_readings on read and uploads
+    can skip writing crash_events. Only a positive answer is remembered for the
+    process, so a transient error during the probe doesn't pin the fallback.
+    """
+    global _detect_crashes_available
+    if _detect_crashes_available:
+        return True
+    client = get_supabase_client()
     if not client:
         return False
     try:
-        client.table("crash_events").upsert(events, on_conflict="start_time,end_time").execute()
+        # An empty range from before any CGM data, so the function reads no readings
+        # and returns no rows; only whether the call succeeds matters
+        client.rpc("detect_crashes", {
+            "range_start": "2000-01-01",
+            "range_end": "2000-01-01",
+            "threshold": DANGER_ZONE_THRESHOLD,
+        }).execute()
+        _detect_crashes_available = True
         return True
     except Exception as e:
-        print(f"Error saving crash events: {e}")
+        print(f"detect_crashes function unavailable, crash events will be uploaded: {e}")
         return False
 
 
-def get_crash_events(start_date: str = None, end_date: str = None) -> list[dict]:
-    """Fetch crash events from Supabase."""
+def detect_crashes_in_db(start_date: str = None, end_date: str = None) -> list[dict]:
+    """Detect crash events server-side from raw glucose readings via the detect_crashes function."""
     client = get_supabase_client()
     if not client:
         return []
     try:
-        query = client.table("crash_events").select("*")
-        if start_date:
-            query = query.gte("timestamp", start_date)
-        if end_date:
-            query = query.lte("timestamp", end_date)
-        result = query.order("timestamp").execute()
-        return result.data
+        def build_query(count=None):
+            # Paged like a table read; PostgREST caps function results at 1000 rows too
+            return client.rpc("detect_crashes", {
+                "range_start": start_date,
+                "range_end": end_date,
+                "threshold": DANGER_ZONE_THRESHOLD,
+            }, count=count).order("start_time")
+
+        return _fetch_all_pages(build_query)
     except Exception as e:
-        print(f"Error fetching crash events: {e}")
+        print(f"Error detecting crash events: {e}")
         return []
 
 
@@ -178,13 +402,41 @@ def get_all_meal_ai_assessments() -> dict:
     if not client:
         return {}
     try:
-        result = client.table("meal_ai_assessments").select("*").execute()
-        return {row['meal_key']: row for row in result.data}
+        # Order by the unique key so pages don't overlap or skip rows
+        rows = _fetch_all_pages(lambda count=None: client.table("meal_ai_assessments").select("*", count=count).order("meal_key"))
+        return {row['meal_key']: row for row in rows}
     except Exception as e:
         print(f"Error fetching meal AI assessments: {e}")
         return {}
 
+
+def get_meal_ai_assessment_keys() -> set[str]:
+    """Fetch the meal_keys that have an AI assessment, without the assessment text."""
+    client = get_supabase_client()
+    if not client:
+        return set()
+    try:
+        rows = _fetch_all_pages(
+            lambda count=None: client.table("meal_ai_assessments")
+            .select("meal_key", count=count)
+            .not_.is_("ai_assessment", "null")
+            .order("meal_key")
+        )
+        return {row['meal_key'] for row in rows}
+    except Exception as e:
+        print(f"Error fetching meal AI assessment keys: {e}")
+        return set()
+
 # Imported Files Tracking
+def _print_imported_files_error(action: str, e: Exception):
+    """Report an imported_files query error, pointing at the migration if the table is missing."""
+    error_str = str(e)
+    if "PGRST205" in error_str or "does not exist" in error_str:
+        print("⚠️ Table 'imported_files' missing. Please run the SQL migration.")
+    else:
+        print(f"Error {action}: {e}")
+
+
 def is_file_already_imported(file_name: str, mtime: float) -> bool:
     """Check if a file with the given name and modification time has already been imported."""
     client = get_supabase_client()
@@ -196,11 +448,7 @@ def is_file_already_imported(file_name: str, mtime: float) -> bool:
         result = client.table("imported_files").select("id").eq("file_name", file_name).eq("file_mtime", mtime_ms).execute()
         return len(result.data) > 0
     except Exception as e:
-        error_str = str(e)
-        if "PGRST205" in error_str or "does not exist" in error_str:
-            print(f"⚠️ Table 'imported_files' missing. Please run the SQL migration.")
-        else:
-            print(f"Error checking imported file: {e}")
+        _print_imported_files_error("checking imported file", e)
         return False
 
 def record_imported_file(file_name: str, mtime: float, file_type: str) -> bool:
@@ -221,6 +469,45 @@ def record_imported_file(file_name: str, mtime: float, file_type: str) -> bool:
         print(f"Error recording imported file: {e}")
         return False
 
+def filter_unimported(files: list[tuple[str, float]]) -> set[tuple[str, int]]:
+    """
+    Return the (file_name, mtime_ms) pairs from files that have not been imported yet.
+
+    Checks every candidate in a single query instead of one round-trip per file.
+    """
+    # Use integer (milliseconds) to avoid floating point precision issues
+    candidates = {(name, int(mtime * 1000)) for name, mtime in files}
+    client = get_supabase_client()
+    if not client or not candidates:
+        return candidates
+    try:
+        names = sorted({name for name, _ in candidates})
+        mtimes = sorted({mtime for _, mtime in candidates})
+        # Filter on both columns so re-downloaded files with a long import history
+        # only return rows that can actually match a candidate
+        result = client.table("imported_files").select("file_name, file_mtime").in_("file_name", names).in_("file_mtime", mtimes).execute()
+        imported = {(row['file_name'], row['file_mtime']) for row in result.data}
+        return candidates - imported
+    except Exception as e:
+        _print_imported_files_error("checking imported files", e)
+        return candidates
+
+def record_imported_files(files: list[tuple[str, float, str]]) -> bool:
+    """Record a batch of (file_name, mtime, file_type) as successfully imported in one request."""
+    client = get_supabase_client()
+    if not client:
+        return False
+    try:
+        records = [
+            {"file_name": name, "file_mtime": int(mtime * 1000), "file_type": file_type}
+            for name, mtime, file_type in files
+        ]
+        client.table("imported_files").upsert(records, on_conflict="file_name,file_mtime").execute()
+        return True
+    except Exception as e:
+        print(f"Error recording imported files: {e}")
+        return False
+
 def get_recently_imported_files(limit: int = 2) -> list[dict]:
     """Fetch the most recently imported files from the database."""
     client = get_supabase_client()
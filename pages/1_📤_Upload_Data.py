@@ -1,10 +1,109 @@
 """Daily data upload page."""
 import streamlit as st
 import pandas as pd
-from utils import parse_libre_csv, parse_cronometer_csv, group_foods_into_meals, merge_meals_with_glucose, calculate_glucose_velocity, detect_crash_events
-from database import save_glucose_readings, save_food_logs, save_crash_events
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from utils import parse_libre_csv, parse_cronometer_csv, group_foods_into_meals, merge_meals_with_glucose, calculate_glucose_velocity, downcast_glucose, detect_crash_events
+from utils import glucose_save_records, food_save_frame, crash_save_records
+from database import save_glucose_readings, save_food_logs, save_crash_events, has_detect_crashes_function
 
 st.title("📤 Daily Data Upload")
+
+
+# Cached processing keyed by the raw upload bytes, so widget reruns skip re-parsing.
+# Downstream steps take the bytes too, which avoids hashing whole DataFrames.
+@st.cache_data(show_spinner=False)
+def parse_cached_libre(libre_content: bytes) -> pd.DataFrame:
+    """Parse a Libre CSV upload with caching."""
+    return parse_libre_csv(BytesIO(libre_content))
+
+
+@st.cache_data(show_spinner=False)
+def parse_cached_cronometer(crono_content: bytes) -> pd.DataFrame:
+    """Parse a Cronometer CSV upload with caching."""
+    return parse_cronometer_csv(BytesIO(crono_content))
+
+
+@st.cache_data(show_spinner=False)
+def summarize_cached_glucose(libre_content: bytes) -> dict:
+    """
+    Compute the glucose preview once per upload.
+
+    Holds the row count, stats and first 20 rows, so preview reruns don't pull
+    (and copy) the full parsed frame out of the cache.
+    """
+    glucose_df = parse_cached_libre(libre_content)
+    stats = glucose_df['glucose_mg_dl'].agg(['min', 'max', 'mean']).to_dict()
+    stats['span_days'] = (glucose_df['timestamp'].max() - glucose_df['timestamp'].min()).days + 1
+    stats['count'] = len(glucose_df)
+    stats['preview'] = glucose_df.head(20).reset_index(drop=True)
+    return stats
+
+
+@st.cache_data(show_spinner=False)
+def analyze_cached_glucose(libre_content: bytes) -> tuple[pd.DataFrame, list[dict]]:
+    """Calculate velocity and detect crash events with caching."""
+    glucose_with_velocity = calculate_glucose_velocity(parse_cached_libre(libre_content))
+    crash_events = detect_crash_events(glucose_with_velocity)
+    # Compact dtypes for the cached copy kept in session state and sent to the database
+    return downcast_glucose(glucose_with_velocity), crash_events
+
+
+@st.cache_data(show_spinner=False)
+def merge_cached_meals(libre_content: bytes, crono_content: bytes) -> pd.DataFrame:
+    """Group foods into meals and merge with glucose readings with caching."""
+    meals_df = group_foods_into_meals(parse_cached_cronometer(crono_content))
+    return merge_meals_with_glucose(parse_cached_libre(libre_content), meals_df)
+
+
+@st.cache_resource
+def get_analysis_executor() -> ThreadPoolExecutor:
+    """Shared worker pool for running the merged analysis alongside page rendering."""
+    return ThreadPoolExecutor(max_workers=2)
+
+
+@st.cache_data(show_spinner=False)
+def build_cached_save_records(libre_content: bytes, crono_content: bytes) -> dict:
+    """Shape the analyzed upload into Supabase payloads once per upload."""
+    glucose_with_velocity, crash_events = analyze_cached_glucose(libre_content)
+    return {
+        'glucose': glucose_save_records(glucose_with_velocity),
+        'food': food_save_frame(parse_cached_cronometer(crono_content)),
+        'crash': crash_save_records(crash_events),
+    }
+
+
+@st.fragment
+def save_to_database(libre_content: bytes, crono_content: bytes):
+    """Save button for the current upload; reruns on its own so a click skips re-analysis."""
+    if st.button("💾 Save to Database", type="primary", width="stretch"):
+        with st.spinner("Saving data..."):
+            records = build_cached_save_records(libre_content, crono_content)
+            glucose_records, food_clean, crash_records = records['glucose'], records['food'], records['crash']
+            # Skip crash_events when the database derives crashes itself via detect_crashes
+            if crash_records and has_detect_crashes_function():
+                crash_records = []
+
+            # Save to Supabase - the tables are independent, so overlap the network round-trips
+            saved = {"glucose readings": True, "food logs": True, "crash events": True}
+            with ThreadPoolExecutor(max_workers=3) as ex:
+                futures = {
+                    ex.submit(save_glucose_readings, glucose_records): "glucose readings",
+                    ex.submit(save_food_logs, food_clean): "food logs",
+                }
+                if crash_records:
+                    futures[ex.submit(save_crash_events, crash_records)] = "crash events"
+                for future in as_completed(futures):
+                    saved[futures[future]] = future.result()
+
+            if all(saved.values()):
+                st.success("✅ All data saved to database!")
+                st.balloons()
+            else:
+                failed = [name for name, ok in saved.items() if not ok]
+                st.warning(f"⚠️ Failed to save: {', '.join(failed)}. Check terminal for error details.")
+
+
 st.markdown("Upload your FreeStyle Libre CGM export and Cronometer food log at the end of each day.")
 
 col1, col2 = st.columns(2)
@@ -32,25 +131,35 @@ if libre_file or crono_file:
     st.divider()
     st.subheader("📊 Data Preview")
 
-    glucose_df = None
+    glucose_stats = None
     food_df = None
 
+    # Kick off the merged analysis now; the previews below are built while it runs.
+    # Both threads hold the GIL for most of their pandas work, so they only truly
+    # overlap where one of them releases it (such as pandas' CSV tokenizer)
+    analysis_futures = None
+    if libre_file and crono_file:
+        executor = get_analysis_executor()
+        analysis_futures = (
+            executor.submit(analyze_cached_glucose, libre_file.getvalue()),
+            executor.submit(merge_cached_meals, libre_file.getvalue(), crono_file.getvalue()),
+        )
+
     # Parse Libre data
     if libre_file:
         try:
-            libre_content = libre_file.getvalue().decode('utf-8')
-            glucose_df = parse_libre_csv(libre_content)
+            glucose_stats = summarize_cached_glucose(libre_file.getvalue())
 
             with st.expander("🩸 Glucose Data Preview", expanded=True):
-                st.success(f"✅ Loaded {len(glucose_df)} glucose readings")
-                st.dataframe(glucose_df.head(20), width="stretch")
+                st.success(f"✅ Loaded {glucose_stats['count']} glucose readings")
+                st.dataframe(glucose_stats['preview'], width="stretch")
 
                 # Quick stats
                 col1, col2, col3, col4 = st.columns(4)
-                col1.metric("Min", f"{glucose_df['glucose_mg_dl'].min():.0f} mg/dL")
-                col2.metric("Max", f"{glucose_df['glucose_mg_dl'].max():.0f} mg/dL")
-                col3.metric("Average", f"{glucose_df['glucose_mg_dl'].mean():.1f} mg/dL")
-                col4.metric("Time Range", f"{(glucose_df['timestamp'].max() - glucose_df['timestamp'].min()).days + 1} days")
+                col1.metric("Min", f"{glucose_stats['min']:.0f} mg/dL")
+                col2.metric("Max", f"{glucose_stats['max']:.0f} mg/dL")
+                col3.metric("Average", f"{glucose_stats['mean']:.1f} mg/dL")
+                col4.metric("Time Range", f"{glucose_stats['span_days']} days")
 
         except Exception as e:
             st.error(f"Error parsing Libre CSV: {e}")
@@ -58,35 +167,32 @@ if libre_file or crono_file:
     # Parse Cronometer data
     if crono_file:
         try:
-            crono_content = crono_file.getvalue().decode('utf-8')
-            food_df = parse_cronometer_csv(crono_content)
+            food_df = parse_cached_cronometer(crono_file.getvalue())
 
             with st.expander("🍎 Food Log Preview", expanded=True):
                 st.success(f"✅ Loaded {len(food_df)} food entries")
-                st.dataframe(food_df.head(20), width="stretch")
+                st.dataframe(food_df.head(20).reset_index(drop=True), width="stretch")
 
                 # Quick stats
+                totals = food_df[['calories', 'carbs_g', 'protein_g']].sum()
                 col1, col2, col3, col4 = st.columns(4)
-                col1.metric("Total Calories", f"{food_df['calories'].sum():.0f} kcal")
-                col2.metric("Total Carbs", f"{food_df['carbs_g'].sum():.0f}g")
-                col3.metric("Total Protein", f"{food_df['protein_g'].sum():.0f}g")
+                col1.metric("Total Calories", f"{totals['calories']:.0f} kcal")
+                col2.metric("Total Carbs", f"{totals['carbs_g']:.0f}g")
+                col3.metric("Total Protein", f"{totals['protein_g']:.0f}g")
                 col4.metric("Entries", len(food_df))
 
         except Exception as e:
             st.error(f"Error parsing Cronometer CSV: {e}")
 
 # Merge and analyze
-if libre_file and crono_file and glucose_df is not None and food_df is not None:
+if libre_file and crono_file and glucose_stats is not None and food_df is not None:
     st.divider()
     st.subheader("🔄 Merged Analysis")
 
-    # Calculate velocity and detect crashes
-    glucose_with_velocity = calculate_glucose_velocity(glucose_df)
-    crash_events = detect_crash_events(glucose_with_velocity)
-
-    # Group foods into meals, then merge with glucose
-    meals_df = group_foods_into_meals(food_df)
-    merged_data = merge_meals_with_glucose(glucose_df, meals_df)
+    # Collect velocity/crash detection and the meal-glucose merge started above
+    with st.spinner("Analyzing crashes..."):
+        glucose_with_velocity, crash_events = analysis_futures[0].result()
+        merged_data = analysis_futures[1].result()
 
     if not merged_data.empty:
         st.success(f"✅ Matched {len(merged_data)} meals with glucose data")
@@ -100,13 +206,13 @@ if libre_file and crono_file and glucose_df is not None and food_df is not None:
     if crash_events:
         st.warning(f"⚠️ Detected {len(crash_events)} crash events (velocity > 2.0 mg/dL/min)")
 
+        # Start-time labels for every crash in one vectorized format
+        start_labels = pd.Series([crash['start_time'] for crash in crash_events]).dt.strftime('%I:%M %p').str.lstrip('0')
+
         with st.expander("🚨 Crash Events", expanded=True):
-            for i, crash in enumerate(crash_events, 1):
+            for i, (crash, start) in enumerate(zip(crash_events, start_labels), 1):
                 col1, col2, col3, col4 = st.columns(4)
                 with col1:
-                    start = crash['start_time']
-                    if hasattr(start, 'strftime'):
-                        start = start.strftime('%I:%M %p').lstrip('0')
                     st.metric(f"Crash #{i}", start)
                 with col2:
                     st.metric("Drop", f"{crash['drop_magnitude']:.1f} mg/dL")
@@ -117,74 +223,16 @@ if libre_file and crono_file and glucose_df is not None and food_df is not None:
     else:
         st.success("✅ No dangerous crash events detected!")
 
-    # Save to database
-    st.divider()
-    if st.button("💾 Save to Database", type="primary", width="stretch"):
-        with st.spinner("Saving data..."):
-            # Prepare data for Supabase - replace NaN with None for JSON compatibility
-            import numpy as np
-
-            # Define schema columns for each table
-            glucose_schema_cols = ['timestamp', 'glucose_mg_dl', 'velocity', 'velocity_smoothed', 'is_danger_zone']
-            food_schema_cols = ['timestamp', 'food_name', 'group', 'calories', 'protein_g', 'carbs_g', 'fat_g', 'fiber_g', 'sugar_g']
-            crash_schema_cols = ['start_time', 'end_time', 'start_glucose', 'end_glucose', 'drop_magnitude', 'average_velocity', 'max_velocity', 'duration_minutes']
-
-            # Filter glucose data to schema columns
-            glucose_cols = [c for c in glucose_schema_cols if c in glucose_with_velocity.columns]
-            glucose_clean = glucose_with_velocity[glucose_cols].replace({np.nan: None})
-            glucose_records = glucose_clean.to_dict('records')
-
-            # Filter food data to schema columns
-            food_cols = [c for c in food_schema_cols if c in food_df.columns]
-            food_clean = food_df[food_cols].replace({np.nan: None})
-            food_records = food_clean.to_dict('records')
-
-            # Rename 'group' to 'meal_group' for database (group is a reserved word)
-            for record in food_records:
-                if 'group' in record:
-                    record['meal_group'] = record.pop('group')
-
-            # Convert timestamps to ISO strings for JSON
-            for record in glucose_records:
-                if 'timestamp' in record and record['timestamp'] is not None:
-                    record['timestamp'] = record['timestamp'].isoformat()
-            for record in food_records:
-                if 'timestamp' in record and record['timestamp'] is not None:
-                    record['timestamp'] = record['timestamp'].isoformat()
-
-            # Convert crash events - filter to schema columns
-            crash_records = []
-            for crash in crash_events:
-                crash_record = {k: v for k, v in crash.items() if k in crash_schema_cols}
-                for key in ['start_time', 'end_time']:
-                    if key in crash_record and hasattr(crash_record[key], 'isoformat'):
-                        crash_record[key] = crash_record[key].isoformat()
-                crash_records.append(crash_record)
-
-            # Save to Supabase
-            glucose_saved = save_glucose_readings(glucose_records)
-            food_saved = save_food_logs(food_records)
-            crash_saved = save_crash_events(crash_records) if crash_records else True
-
-            if glucose_saved and food_saved and crash_saved:
-                st.success("✅ All data saved to database!")
-                st.balloons()
-            else:
-                failed = []
-                if not glucose_saved:
-                    failed.append("glucose readings")
-                if not food_saved:
-                    failed.append("food logs")
-                if not crash_saved:
-                    failed.append("crash events")
-                st.warning(f"⚠️ Failed to save: {', '.join(failed)}. Check terminal for error details.")
-
     # Store in session for other pages
     st.session_state['glucose_df'] = glucose_with_velocity
     st.session_state['food_df'] = food_df
     st.session_state['merged_data'] = merged_data
     st.session_state['crash_events'] = crash_events
 
+    # Save to database
+    st.divider()
+    save_to_database(libre_file.getvalue(), crono_file.getvalue())
+
 # Sidebar help
 with st.sidebar:
     st.header("📖 How to Export Data")
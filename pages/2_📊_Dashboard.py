@@ -1,56 +1,488 @@
 """Dashboard with glucose visualizations and crash analysis."""
 import streamlit as st
 import pandas as pd
-import plotly.express as px
+import numpy as np
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 from datetime import datetime, timedelta
-from utils import calculate_glucose_velocity, detect_crash_events, get_crash_summary_stats, group_foods_into_meals, merge_meals_with_glucose, analyze_meal_response
-from database import get_glucose_readings, get_food_logs, get_crash_events, get_meal_ai_assessment, save_meal_ai_assessment, get_all_meal_ai_assessments
-from services.gemini_service import analyze_meal_with_ai
+from concurrent.futures import ThreadPoolExecutor
+from html import escape
+from utils import calculate_glucose_velocity, downcast_glucose, detect_crash_events, get_crash_summary_stats, group_foods_into_meals, merge_meals_with_glucose, analyze_meal_responses, minmax_lttb_downsample, day_numbers
+from database import get_glucose_readings_df, get_food_logs_df, get_table_fingerprint, get_crash_events, get_meal_ai_assessment, save_meal_ai_assessment, get_meal_ai_assessment_keys
 from config import DANGER_ZONE_THRESHOLD
 
 st.title("📊 Glucose Dashboard")
 
-
-@st.cache_data(show_spinner="Fetching glucose data...")
-def get_cached_glucose():
-    """Fetch and process glucose data from database with caching."""
-    glucose_data = get_glucose_readings()
-    if not glucose_data:
-        return None
-    df = pd.DataFrame(glucose_data)
-    df['timestamp'] = pd.to_datetime(df['timestamp'])
+# Hex values of Streamlit's named markdown colors, for HTML-rendered stats
+STAT_COLORS = {"red": "#ff4b4b", "orange": "#ffa421", "green": "#21c354", "gray": "#808495"}
+
+# Meal group icons
+MEAL_ICONS = {
+    'Breakfast': '🌅',
+    'Lunch': '☀️',
+    'Dinner': '🌙',
+    'Snack': '🍎',
+    'Snack 1': '🍎',
+    'Snack 2': '🍎',
+    'Snack 3': '🍎',
+}
+DEFAULT_MEAL_ICON = '🍽️'
+
+# Expander badge for each meal risk category
+RISK_EMOJIS = {
+    'Reactive': '🔴',
+    'Normal': '🟡',
+    'Great': '🟢',
+    'Partial Data': '🔄',
+    'Awaiting Data': '⏳',
+}
+DEFAULT_RISK_EMOJI = '⚪'
+
+# Meal risk categories; a meal's risk code is its position in this tuple
+RISK_CATEGORIES = ("Great", "Normal", "Reactive", "Partial Data", "Awaiting Data")
+
+# Meal expanders laid out per page of the meal list
+MEALS_PER_PAGE = 25
+
+# Macro columns passed to Gemini with each meal, in payload order
+MACRO_COLS = ("carbs_g", "protein_g", "fat_g", "fiber_g", "sugar_g")
+
+# Meals sent to Gemini per request when assessing a page of meals at once
+AI_BATCH_SIZE = 8
+
+
+def epoch_ms(timestamps: pd.Series) -> np.ndarray:
+    """Wall-clock epoch milliseconds of each timestamp, for compact Plotly date axes."""
+    if timestamps.dt.tz is not None:
+        timestamps = timestamps.dt.tz_localize(None)
+    return timestamps.to_numpy().astype('datetime64[ms]').view('i8')
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def get_data_fingerprint() -> tuple:
+    """
+    Row counts, latest timestamps and write counts of the glucose and food tables.
+
+    Polled at most once a minute; the cached loaders below take it as an
+    argument, so they reload only after rows are added or corrected.
+    """
+    return get_table_fingerprint("glucose_readings"), get_table_fingerprint("food_logs")
+
+
+@st.cache_resource(show_spinner="Fetching glucose data...", max_entries=2)
+def get_cached_glucose(glucose_fingerprint: tuple) -> tuple[pd.DataFrame | None, list[dict]]:
+    """
+    Fetch and process glucose data from database with caching.
+
+    Crash events are detected in the same load, right after the velocities they
+    come from. Both are shared rather than copied on every rerun, so callers
+    must not modify them.
+    """
+    df = get_glucose_readings_df()
+    if df.empty:
+        return None, []
     # Initial velocity calculation for the whole dataset
-    return calculate_glucose_velocity(df)
+    df = calculate_glucose_velocity(df)
+    df['day_i8'] = day_numbers(df['timestamp'])
+    crash_events = detect_crash_events(df)
+    # Keep the readings in the same compact dtypes as uploaded data (int16 readings,
+    # float32 velocities); crashes above are detected at full precision, as on upload
+    return downcast_glucose(df), crash_events
 
 
-@st.cache_data(show_spinner="Fetching food logs...")
-def get_cached_food():
+@st.cache_data(show_spinner="Fetching food logs...", max_entries=2)
+def get_cached_food(food_fingerprint: tuple):
     """Fetch and process food logs from database with caching."""
-    food_data = get_food_logs()
-    if not food_data:
+    df = get_food_logs_df()
+    if df.empty:
         return None
-    df = pd.DataFrame(food_data)
-    df['timestamp'] = pd.to_datetime(df['timestamp'])
-    # Map meal_group back to group for grouping functions
+    # Map meal_group back to group for grouping functions; a handful of repeated
+    # names, so store them as a categorical
     if 'meal_group' in df.columns:
-        df['group'] = df['meal_group']
+        df['group'] = df['meal_group'].astype('category')
     elif 'group' not in df.columns:
-        df['group'] = 'Uncategorized'
+        df['group'] = pd.Categorical(['Uncategorized'] * len(df))
     # Add day column for grouping
     df['day'] = df['timestamp'].dt.date
+    df['day_i8'] = day_numbers(df['timestamp'])
     return df
 
 
-@st.cache_data(show_spinner="Analyzing crashes...")
+def hash_frame(df: pd.DataFrame) -> tuple:
+    """
+    Cache key for a DataFrame from its shape, time span and content checksums.
+
+    Numeric columns are summed; the rest (timestamps, food names, meal groups)
+    are hashed with pandas' vectorized row hashing, so regrouping or renaming
+    foods changes the key. Much cheaper than Streamlit's default DataFrame
+    hashing on each rerun.
+    """
+    if df.empty:
+        return (df.shape, tuple(df.columns))
+    timestamps = df['timestamp']
+    checksum = float(df.select_dtypes('number').to_numpy(dtype=float, na_value=0).sum())
+    other_hash = int(pd.util.hash_pandas_object(df.select_dtypes(exclude='number'), index=False).sum())
+    return (df.shape, tuple(df.columns), timestamps.iat[0].value, timestamps.iat[-1].value, checksum, other_hash)
+
+
+@st.cache_resource(show_spinner="Analyzing crashes...", max_entries=2, hash_funcs={pd.DataFrame: hash_frame})
 def get_cached_crashes(glucose_df):
-    """Detect crash events with caching."""
+    """
+    Detect crash events with caching.
+
+    The list is shared rather than copied on every rerun, so its identity also
+    keys get_crash_days; callers must not modify it.
+    """
     if glucose_df is None or glucose_df.empty:
         return []
     return detect_crash_events(glucose_df)
 
 
+# Meal frames are kept as shared objects rather than copied on every cache hit,
+# so callers must copy them before adding columns. They are keyed by the range's
+# hash_frame keys (see range_key below) instead of hashing the frames on each call.
+@st.cache_resource(show_spinner=False, max_entries=8)
+def get_cached_meals(food_key: tuple, _food_df):
+    """Group foods into meals with caching."""
+    return group_foods_into_meals(_food_df)
+
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def get_cached_merged_meals(range_key: tuple, _glucose_df, _food_df):
+    """Merge meals with glucose readings with caching."""
+    return merge_meals_with_glucose(_glucose_df, get_cached_meals(range_key[1], _food_df))
+
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def get_cached_meal_responses(range_key: tuple, _glucose_df, _food_df):
+    """
+    Analyze every merged meal's glucose response with caching.
+
+    Keyed like the merged meals, so a meal's analysis is only recomputed when
+    new readings or food logs arrive for the range.
+    """
+    responses = analyze_meal_responses(get_cached_merged_meals(range_key, _glucose_df, _food_df))
+    if responses.empty:
+        return responses
+
+    # Rise/Drop stat colors for the meal expanders, looked up once per range instead
+    # of per render ("above x" thresholds are "at or above the next float after x")
+    responses['peak_color'] = ladder_colors(responses['peak_glucose'], [120, np.nextafter(140, np.inf)], ("green", "orange", "red"))
+    responses['delta_color'] = ladder_colors(responses['glucose_rise'], [30, np.nextafter(50, np.inf)], ("green", "orange", "red"))
+    responses['vel_color'] = ladder_colors(responses['max_rise_velocity'], [1.5, np.nextafter(2.5, np.inf)], ("green", "orange", "red"))
+    responses['floor_color'] = ladder_colors(responses['min_glucose'], [65, np.nextafter(75, np.inf)], ("red", "orange", "green"))
+    responses['drop_vel_color'] = ladder_colors(responses['max_drop_velocity'].abs(), [1.0, np.nextafter(1.5, np.inf)], ("green", "orange", "red"))
+    return responses
+
+
+@st.cache_resource(show_spinner=False)
+def get_shared_ai_assessment_keys() -> set:
+    """
+    Fetch the meal_keys that have an AI assessment once and share them across sessions.
+
+    The returned set is mutated in place when a new assessment is generated.
+    """
+    return get_meal_ai_assessment_keys()
+
+
+@st.cache_resource
+def get_shared_ai_assessments() -> dict:
+    """Assessments fetched so far, indexed by meal_key and shared across sessions."""
+    return {}
+
+
+def get_ai_assessment(meal_key: str) -> dict | None:
+    """Look up a meal's AI assessment, fetching its text on first use."""
+    assessments = get_shared_ai_assessments()
+    if meal_key not in assessments and meal_key in get_shared_ai_assessment_keys():
+        assessment = get_meal_ai_assessment(meal_key)
+        if assessment is not None:
+            assessments[meal_key] = assessment
+    return assessments.get(meal_key)
+
+
+@st.cache_resource
+def get_ai_save_executor() -> ThreadPoolExecutor:
+    """Background pool for AI assessment database writes."""
+    return ThreadPoolExecutor(max_workers=2)
+
+
+def report_failed_ai_saves():
+    """Warn about background AI assessment saves that failed since the last rerun."""
+    pending = st.session_state.get('pending_ai_saves', [])
+    failed = [meal_key for meal_key, future in pending if future.done() and not future.result()]
+    st.session_state['pending_ai_saves'] = [(meal_key, future) for meal_key, future in pending if not future.done()]
+    for meal_key in failed:
+        # Drop it from the shared cache so the meal offers to generate it again
+        get_shared_ai_assessments().pop(meal_key, None)
+        get_shared_ai_assessment_keys().discard(meal_key)
+    if failed:
+        st.warning(f"Could not save {len(failed)} AI assessment(s) to the database. Generate them again to retry.")
+
+
+def colored(text: str, color: str) -> str:
+    """Bold text in one of Streamlit's named markdown colors."""
+    return f'<b style="color: {STAT_COLORS[color]};">{text}</b>'
+
+
+def ladder_colors(values, thresholds: list, colors: tuple) -> np.ndarray:
+    """
+    Named color for every value from ascending thresholds, in one searchsorted lookup.
+
+    Values below thresholds[0] get colors[0], values at or above thresholds[i] get
+    colors[i + 1], and NaN gets green like the stat's "else" branch would.
+    """
+    values = np.asarray(values, dtype=float)
+    picked = np.asarray(colors, dtype=object)[np.searchsorted(thresholds, values, side='right')]
+    picked[np.isnan(values)] = "green"
+    return picked
+
+
+def meal_analysis(meal_responses: pd.DataFrame, idx) -> dict:
+    """One meal's analysis from analyze_meal_responses, shaped like analyze_meal_response's dict."""
+    if idx not in meal_responses.index:
+        return {}
+    analysis = meal_responses.loc[idx].to_dict()
+    # Crash details only exist for meals with a crash
+    return {k: v for k, v in analysis.items() if not k.startswith('crash_') or analysis['crash_detected']}
+
+
+def meal_details_html(meal, analysis: dict, has_any_data: bool) -> str:
+    """HTML for a meal expander's foods grid and Rise/Drop/Macros/Ratios columns."""
+    parts = []
+
+    # Foods in this meal with timestamps in a 3-column grid
+    if meal.foods_with_times:
+        cells = []
+        for food_item in meal.foods_with_times:
+            cells.append(f'<div><span style="color: {STAT_COLORS["gray"]};">{food_item["time"]}</span> <b>{escape(food_item["name"])}</b></div>')
+        parts.append('<p><b>🍽️ Foods in this meal:</b></p>')
+        parts.append(f'<div style="display: grid; grid-template-columns: repeat(3, 1fr); gap: 4px 16px;">{"".join(cells)}</div>')
+    elif meal.foods:
+        # Fallback to simple list if no timestamps available
+        parts.append(f'<p><b>Foods:</b> {escape(", ".join(meal.foods))}</p>')
+
+    parts.append('<hr>')
+
+    heading = '<div style="font-weight: 600; font-size: 1.1em; margin-bottom: 8px;">{}</div>'
+    no_data = '<div>No data available</div>'
+
+    rise = [heading.format('📈 Rise Analysis')]
+    drop = [heading.format('📉 Drop Analysis')]
+    if has_any_data:
+        peak = analysis.get('peak_glucose') or 0
+        rise_delta = analysis.get('glucose_rise') or 0
+        rise_vel = analysis.get('max_rise_velocity') or 0
+        rise_dur = analysis.get('time_to_peak_minutes') or 0
+
+        rise += [
+            f'<div>Peak: {colored(f"{peak:.0f} mg/dL", analysis["peak_color"])}</div>',
+            f'<div>Rise Delta: {colored(f"+{rise_delta:.0f} mg/dL", analysis["delta_color"])}</div>',
+            f'<div>Rise Velocity: {colored(f"{rise_vel:.2f} mg/dL/min", analysis["vel_color"])}</div>',
+            f'<div>Duration: <b>{rise_dur:.0f} min</b></div>',
+        ]
+
+        floor = analysis.get('min_glucose') or 0
+        drop_vel = abs(analysis.get('max_drop_velocity') or 0)
+        total_drop = analysis.get('total_drop') or 0
+        drop_dur = analysis.get('drop_duration_minutes') or 0
+
+        drop += [
+            f'<div>Min Floor: {colored(f"{floor:.0f} mg/dL", analysis["floor_color"])}</div>',
+            f'<div>Max Drop Vel: {colored(f"{drop_vel:.2f} mg/dL/min", analysis["drop_vel_color"])}</div>',
+            f'<div>Total Drop: <b>{total_drop:.0f} mg/dL</b></div>',
+            f'<div>Duration: <b>{drop_dur:.0f} min</b></div>',
+        ]
+    else:
+        rise.append(no_data)
+        drop.append(no_data)
+
+    macros = [
+        heading.format('🍎 Macros'),
+        f'<div>Carbs: <b>{meal.carbs_g:.1f}g</b></div>',
+        f'<div>Protein: <b>{meal.protein_g:.1f}g</b></div>',
+        f'<div>Fat: <b>{meal.fat_g:.1f}g</b></div>',
+        f'<div>Calories: <b>{meal.calories:.0f} kcal</b></div>',
+    ]
+
+    ratios = [
+        heading.format('📊 Ratios & More'),
+        f'<div>P:C Ratio: <b>{meal.p_c_ratio:.2f}</b></div>',
+        f'<div>Fiber: {colored(f"{meal.fiber_g:.1f}g", meal.fiber_color)}</div>',
+        f'<div>Sugar: {colored(f"{meal.sugar_g:.1f}g", meal.sugar_color)}</div>',
+        f'<div>Food Items: <b>{meal.food_count}</b></div>',
+    ]
+
+    columns = "".join(f'<div>{"".join(col)}</div>' for col in (rise, drop, macros, ratios))
+    parts.append(f'<div style="display: grid; grid-template-columns: repeat(4, 1fr); gap: 16px; line-height: 1.8;">{columns}</div>')
+    return "".join(parts)
+
+
+@st.cache_resource(show_spinner=False, max_entries=32)
+def build_meal_chart(group_name: str, glucose_readings: dict) -> go.Figure:
+    """
+    Glucose and velocity mini chart for one meal's readings.
+
+    Drawn as SVG rather than WebGL: a meal's traces are only a few hundred points,
+    and browsers cap WebGL contexts per page (8-16), which a page of open meals
+    would exhaust.
+
+    Cached so reopening a meal or rerunning the meal section reuses the figure.
+    The returned figure is shared, so callers must not modify it.
+    """
+    # Create subplot with glucose and velocity
+    fig_meal = make_subplots(
+        rows=2, cols=1,
+        shared_xaxes=True,
+        vertical_spacing=0.1,
+        row_heights=[0.7, 0.3],
+        subplot_titles=(f"Glucose Response: {group_name}", "Velocity (mg/dL/min)")
+    )
+
+    # Glucose trace
+    fig_meal.add_trace(
+        go.Scatter(
+            x=glucose_readings['minutes_from_meal'],
+            y=glucose_readings['glucose_mg_dl'],
+            mode='lines+markers',
+            name='Glucose',
+            line=dict(color='#1f77b4', width=2)
+        ),
+        row=1, col=1
+    )
+    fig_meal.add_hline(y=70, line_dash="dash", line_color="orange", opacity=0.5, row=1, col=1)
+    fig_meal.add_hline(y=140, line_dash="dash", line_color="orange", opacity=0.5, row=1, col=1)
+
+    # Velocity trace if available
+    if 'velocity_smoothed' in glucose_readings:
+        fig_meal.add_trace(
+            go.Scatter(
+                x=glucose_readings['minutes_from_meal'],
+                y=glucose_readings['velocity_smoothed'],
+                mode='lines',
+                name='Velocity',
+                line=dict(color='purple', width=1.5)
+            ),
+            row=2, col=1
+        )
+        fig_meal.add_hline(y=-DANGER_ZONE_THRESHOLD, line_dash="dash", line_color="red", row=2, col=1)
+        fig_meal.add_hline(y=0, line_dash="solid", line_color="gray", opacity=0.3, row=2, col=1)
+
+    fig_meal.update_xaxes(title_text="Minutes from Meal", row=2, col=1)
+    fig_meal.update_yaxes(title_text="mg/dL", row=1, col=1)
+    fig_meal.update_yaxes(title_text="mg/dL/min", row=2, col=1)
+
+    return fig_meal
+
+
+def meal_ai_payload(meal, macros: list[float], analysis: dict) -> dict:
+    """Meal details and glucose response metrics sent to Gemini for one meal."""
+    return {
+        'meal_key': meal.meal_key,
+        'meal_time': meal.meal_time.isoformat(),
+        'group_name': meal.group,
+        'foods': meal.foods,
+        **dict(zip(MACRO_COLS, macros)),
+        'baseline_glucose': float(analysis.get('baseline_glucose', 0)),
+        'peak_glucose': float(analysis.get('peak_glucose', 0)),
+        'glucose_rise': float(analysis.get('glucose_rise', 0)),
+        'max_drop_velocity': float(analysis.get('max_drop_velocity', 0)),
+        'total_drop': float(analysis.get('total_drop', 0)),
+        'crash_detected': analysis.get('crash_detected', False),
+    }
+
+
+def store_ai_assessment(meal_data: dict):
+    """
+    Cache a new AI assessment and save it to the database in the background.
+
+    report_failed_ai_saves picks up a failed write on a later rerun.
+    """
+    meal_key = meal_data['meal_key']
+    get_shared_ai_assessments()[meal_key] = meal_data
+    get_shared_ai_assessment_keys().add(meal_key)
+    future = get_ai_save_executor().submit(save_meal_ai_assessment, meal_data)
+    st.session_state.setdefault('pending_ai_saves', []).append((meal_key, future))
+
+
+def generate_ai_assessments(meals: list[dict]) -> int:
+    """
+    Generate and store AI assessments for several meals, AI_BATCH_SIZE per Gemini request.
+
+    Returns the number of meals that got an assessment.
+    """
+    from services.gemini_service import analyze_meals_batch
+    assessed = 0
+    for start in range(0, len(meals), AI_BATCH_SIZE):
+        batch = meals[start:start + AI_BATCH_SIZE]
+        for meal_data, ai_text in zip(batch, analyze_meals_batch(batch)):
+            if ai_text:
+                store_ai_assessment({**meal_data, 'ai_assessment': ai_text})
+                assessed += 1
+    return assessed
+
+
+@st.fragment
+def meal_ai_assessment(meal_data: dict):
+    """
+    AI assessment block for one meal.
+
+    Runs as a fragment so generating an assessment reruns only this block,
+    not the whole dashboard.
+    """
+    meal_key = meal_data['meal_key']
+    existing_assessment = get_ai_assessment(meal_key)
+
+    # The button and the assessment that replaces it share one slot, so no rerun is needed
+    slot = st.empty()
+    if existing_assessment is not None and existing_assessment.get('ai_assessment'):
+        with slot.container():
+            st.markdown("### 🤖 AI Assessment")
+            st.markdown(existing_assessment.get('ai_assessment', ''))
+    elif slot.button("🤖 Generate AI Assessment", key=f"ai_btn_{meal_key}"):
+        with st.spinner("Generating AI assessment..."):
+            # Call Gemini API (imported here so page loads don't pay for the SDK import)
+            from services.gemini_service import analyze_meal_with_ai
+            ai_text = analyze_meal_with_ai(meal_data)
+            meal_data = {**meal_data, 'ai_assessment': ai_text}
+
+        # Show and cache the assessment now; the database write runs in the background
+        store_ai_assessment(meal_data)
+        with slot.container():
+            st.markdown("### 🤖 AI Assessment")
+            st.markdown(ai_text)
+
+
+def get_crash_days(crash_events: list[dict] | None) -> np.ndarray:
+    """
+    Start day of each crash as int64 day numbers, for date-range slices.
+
+    Crash events are in time order, so the days are sorted. They are rebuilt
+    only when a different crash list is loaded, not on every rerun.
+    """
+    if not crash_events:
+        return np.empty(0, dtype=np.int64)
+    cached = st.session_state.get('crash_days')
+    if cached is None or cached[0] is not crash_events:
+        cached = (crash_events, day_numbers(pd.Series([c['start_time'] for c in crash_events])))
+        st.session_state['crash_days'] = cached
+    return cached[1]
+
+
+def get_session_crashes(glucose_df: pd.DataFrame) -> list[dict]:
+    """
+    Crash events for a session glucose frame that came without them.
+
+    The frame stays the same object across reruns, so the crashes are kept with
+    it and get_cached_crashes only hashes the frame when a new one is loaded.
+    """
+    cached = st.session_state.get('session_crashes')
+    if cached is None or cached[0] is not glucose_df:
+        cached = (glucose_df, get_cached_crashes(glucose_df))
+        st.session_state['session_crashes'] = cached
+    return cached[1]
+
+
 def load_data():
     """Load data from session state or database."""
     glucose_df = st.session_state.get('glucose_df')
@@ -58,19 +490,30 @@ def load_data():
     crash_events = st.session_state.get('crash_events')
 
     # If no session data, try loading from database
+    if glucose_df is None or food_df is None:
+        glucose_fingerprint, food_fingerprint = get_data_fingerprint()
+
     if glucose_df is None:
-        glucose_df = get_cached_glucose()
+        glucose_df, loaded_crashes = get_cached_glucose(glucose_fingerprint)
+        if crash_events is None:
+            crash_events = loaded_crashes
 
     if food_df is None:
-        food_df = get_cached_food()
+        food_df = get_cached_food(food_fingerprint)
 
     if crash_events is None and glucose_df is not None:
-        crash_events = get_cached_crashes(glucose_df)
+        crash_events = get_session_crashes(glucose_df)
 
-    return glucose_df, food_df, crash_events
+    # Frames handed over from the upload page don't carry the day column yet
+    if glucose_df is not None and 'day_i8' not in glucose_df.columns:
+        glucose_df = glucose_df.assign(day_i8=day_numbers(glucose_df['timestamp']))
+    if food_df is not None and not food_df.empty and 'day_i8' not in food_df.columns:
+        food_df = food_df.assign(day_i8=day_numbers(food_df['timestamp']))
 
+    return glucose_df, food_df, crash_events, get_crash_days(crash_events)
 
-glucose_df, food_df, crash_events = load_data()
+
+glucose_df, food_df, crash_events, crash_days = load_data()
 
 if glucose_df is None or glucose_df.empty:
     st.info("👋 Welcome! Upload your CGM and food data on the **Upload Data** page to see your dashboard.")
@@ -119,35 +562,80 @@ date_range = st.sidebar.date_input(
 
 if len(date_range) == 2:
     start_date, end_date = date_range
-    mask = (glucose_df['timestamp'].dt.date >= start_date) & (glucose_df['timestamp'].dt.date <= end_date)
-    filtered_glucose = glucose_df[mask].copy()
+    start_i8 = np.datetime64(start_date, 'D').astype(np.int64)
+    end_i8 = np.datetime64(end_date, 'D').astype(np.int64)
+    # Readings are sorted by timestamp (calculate_glucose_velocity sorts them), so the
+    # range is one contiguous slice found by binary search; nothing below mutates it
+    glucose_days = glucose_df['day_i8'].to_numpy()
+    lo = np.searchsorted(glucose_days, start_i8, side='left')
+    hi = np.searchsorted(glucose_days, end_i8, side='right')
+    filtered_glucose = glucose_df.iloc[lo:hi]
+
+    # Food logs are sorted the same way; the chart and meal section share this slice
+    filtered_food = food_df
+    if food_df is not None and not food_df.empty:
+        food_days = food_df['day_i8'].to_numpy()
+        lo = np.searchsorted(food_days, start_i8, side='left')
+        hi = np.searchsorted(food_days, end_i8, side='right')
+        filtered_food = food_df.iloc[lo:hi]
+
+    # Crashes in the range, as a slice of the time-ordered events
+    crash_lo = np.searchsorted(crash_days, start_i8, side='left')
+    crash_hi = np.searchsorted(crash_days, end_i8, side='right')
+
+    # Nothing to chart, analyze or list: skip the rest of the page. Meals logged on
+    # days without readings still render below (as awaiting data), so only stop
+    # when there is no food in the range either.
+    if filtered_glucose.empty and (filtered_food is None or filtered_food.empty):
+        st.info("No glucose readings or meals in the selected date range.")
+        st.stop()
 else:
-    filtered_glucose = glucose_df.copy()
+    filtered_glucose = glucose_df
+    filtered_food = food_df
+    crash_lo, crash_hi = 0, len(crash_days)
+
+# Cache key for the range's readings and food logs, hashed once per run instead of
+# by every cached function (and meal fragment rerun) the slices are passed to
+range_key = (hash_frame(filtered_glucose), hash_frame(filtered_food) if filtered_food is not None else None)
 
 # Summary metrics
 st.subheader("📈 Summary Metrics")
 col1, col2, col3, col4, col5 = st.columns(5)
 
+# Glucose metrics from one numpy array rather than a chain of pandas Series ops
+# Stats come from the full-resolution readings, not the downsampled chart data.
+# The readings stay in their stored dtype (int16 after downcast_glucose) instead
+# of a float64 copy; only the mean's accumulator is float64.
+glucose_values = filtered_glucose['glucose_mg_dl'].to_numpy()
+if len(glucose_values):
+    avg_glucose = glucose_values.mean(dtype=np.float64)
+    # In-range is whatever is neither low nor high, so two comparisons cover all three bands
+    low_count = np.count_nonzero(glucose_values < 70)
+    high_count = np.count_nonzero(glucose_values > 140)
+    time_in_range = (len(glucose_values) - low_count - high_count) / len(glucose_values) * 100
+    time_low = low_count / len(glucose_values) * 100
+else:
+    avg_glucose = time_in_range = time_low = np.nan
+
+# Crash stats for the Avg Drop metric and the sidebar, computed once per run
+crash_stats = get_crash_summary_stats(crash_events)
+
 with col1:
-    avg_glucose = filtered_glucose['glucose_mg_dl'].mean()
     st.metric("Avg Glucose", f"{avg_glucose:.0f} mg/dL")
 
 with col2:
-    time_in_range = ((filtered_glucose['glucose_mg_dl'] >= 70) & (filtered_glucose['glucose_mg_dl'] <= 140)).mean() * 100
     st.metric("Time in Range", f"{time_in_range:.0f}%", help="70-140 mg/dL")
 
 with col3:
-    time_low = (filtered_glucose['glucose_mg_dl'] < 70).mean() * 100
     st.metric("Time Low", f"{time_low:.1f}%", help="<70 mg/dL")
 
 with col4:
-    crash_count = len([c for c in crash_events if start_date <= c['start_time'].date() <= end_date]) if crash_events else 0
+    crash_count = int(crash_hi - crash_lo)
     st.metric("Crash Events", crash_count)
 
 with col5:
     if crash_events:
-        stats = get_crash_summary_stats(crash_events)
-        st.metric("Avg Drop", f"{stats['avg_drop_magnitude']:.0f} mg/dL")
+        st.metric("Avg Drop", f"{crash_stats['avg_drop_magnitude']:.0f} mg/dL")
     else:
         st.metric("Avg Drop", "N/A")
 
@@ -156,210 +644,217 @@ st.divider()
 # Main glucose chart
 st.subheader("🩸 Glucose Over Time")
 
-# Performance optimization: Downsample if data is too dense (more than ~3 days of 5-min data)
-# 12 readings/hour * 24 hours * 3 days = 864 readings
-chart_df = filtered_glucose.copy()
-if len(chart_df) > 1000:
-    # Resample to 15-min intervals for the chart if many days selected
-    chart_df = chart_df.set_index('timestamp').resample('15T').agg({
-        'glucose_mg_dl': 'mean',
-        'velocity_smoothed': 'mean',
-        'is_danger_zone': 'max'
-    }).reset_index().dropna(subset=['glucose_mg_dl'])
-
-fig = make_subplots(
-    rows=2, cols=1,
-    shared_xaxes=True,
-    vertical_spacing=0.1,
-    row_heights=[0.7, 0.3],
-    subplot_titles=("Glucose Level", "Glucose Velocity")
-)
+# Point budget for each trace of the main chart
+CHART_MAX_POINTS = 2000
+
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def build_glucose_chart(range_key: tuple, _filtered_glucose: pd.DataFrame, _filtered_food: pd.DataFrame | None, crash_windows: tuple) -> go.Figure:
+    """
+    Glucose and velocity chart for the selected range, built once per range and data version.
+
+    Cached as a resource so reruns that don't change the range (widget clicks,
+    fragment reruns elsewhere) reuse the figure instead of rebuilding every trace
+    and shape. The returned figure is shared, so callers must not modify it.
+    """
+    # Performance optimization: Downsample if data is too dense (more than ~7 days of 5-min data)
+    # MinMaxLTTB keeps the peaks and troughs (crashes included) that mean bins would smooth away
+    chart_df = _filtered_glucose
+    if len(chart_df) > CHART_MAX_POINTS:
+        chart_x = (chart_df['timestamp'] - chart_df['timestamp'].iloc[0]).dt.total_seconds().to_numpy()
+        keep = minmax_lttb_downsample(chart_x, chart_df['glucose_mg_dl'].to_numpy(), CHART_MAX_POINTS)
+        if 'velocity_smoothed' in chart_df.columns:
+            # Keep the velocity trace's extremes too; both traces share the same rows
+            velocity = chart_df['velocity_smoothed'].fillna(0).to_numpy()
+            keep = np.union1d(keep, minmax_lttb_downsample(chart_x, velocity, CHART_MAX_POINTS))
+        chart_df = chart_df.iloc[keep]
+
+    # Send the traces as compact typed arrays rather than ISO strings and float64:
+    # wall-clock epoch milliseconds for the date axis and float32 values
+    chart_x = epoch_ms(chart_df['timestamp'])
+
+    fig = make_subplots(
+        rows=2, cols=1,
+        shared_xaxes=True,
+        vertical_spacing=0.1,
+        row_heights=[0.7, 0.3],
+        subplot_titles=("Glucose Level", "Glucose Velocity")
+    )
 
-# Glucose trace - Use Scattergl for performance
-fig.add_trace(
-    go.Scattergl(
-        x=chart_df['timestamp'],
-        y=chart_df['glucose_mg_dl'],
-        mode='lines',
-        name='Glucose',
-        line=dict(color='#1f77b4', width=2),
-        hovertemplate='%{x|%b %d, %I:%M %p}<br>Glucose: %{y:.0f} mg/dL<extra></extra>'
-    ),
-    row=1, col=1
-)
+    # Glucose trace - Use Scattergl for performance
+    fig.add_trace(
+        go.Scattergl(
+            x=chart_x,
+            y=chart_df['glucose_mg_dl'].to_numpy(dtype=np.float32),
+            mode='lines',
+            name='Glucose',
+            line=dict(color='#1f77b4', width=2),
+            hovertemplate='%{x|%b %d, %I:%M %p}<br>Glucose: %{y:.0f} mg/dL<extra></extra>'
+        ),
+        row=1, col=1
+    )
 
-# Add target range (Shapes are okay if limited in number)
-fig.add_hrect(y0=70, y1=140, line_width=0, fillcolor="green", opacity=0.1, row=1, col=1)
-fig.add_hline(y=70, line_dash="dash", line_color="orange", opacity=0.5, row=1, col=1)
-fig.add_hline(y=140, line_dash="dash", line_color="orange", opacity=0.5, row=1, col=1)
+    # Add target range (Shapes are okay if limited in number)
+    fig.add_hrect(y0=70, y1=140, line_width=0, fillcolor="green", opacity=0.1, row=1, col=1)
+    fig.add_hline(y=70, line_dash="dash", line_color="orange", opacity=0.5, row=1, col=1)
+    fig.add_hline(y=140, line_dash="dash", line_color="orange", opacity=0.5, row=1, col=1)
 
-# Mark crash events
-if crash_events:
-    for crash in crash_events:
-        crash_start = crash['start_time']
-        if hasattr(crash_start, 'date') and start_date <= crash_start.date() <= end_date:
-            fig.add_vrect(
-                x0=crash['start_time'],
-                x1=crash['end_time'],
-                fillcolor="red",
+    # Mark crash events as one filled trace rather than a layout shape per crash: each crash
+    # is a (start, start, end, end, gap) rectangle on a hidden [0, 1] axis overlaying the
+    # glucose plot, so the bands span its full height like vrects did
+    if crash_windows:
+        starts, ends = (epoch_ms(pd.Series(times)) for times in zip(*crash_windows))
+        fig.add_trace(
+            go.Scatter(
+                x=np.column_stack([starts, starts, ends, ends, ends]).ravel(),
+                y=np.tile(np.array([0, 1, 1, 0, np.nan], dtype=np.float32), len(crash_windows)),
+                mode='lines',
+                fill='toself',
+                fillcolor='red',
                 opacity=0.2,
                 line_width=0,
-                row=1, col=1
+                yaxis='y3',
+                showlegend=False,
+                hoverinfo='skip'
             )
+        )
+        fig.update_layout(yaxis3=dict(overlaying='y', range=[0, 1], visible=False, fixedrange=True))
 
-# Add food markers if available
-if food_df is not None and not food_df.empty:
-    food_mask = (food_df['timestamp'].dt.date >= start_date) & (food_df['timestamp'].dt.date <= end_date)
-    filtered_food = food_df[food_mask]
-
-    if not filtered_food.empty:
+    # Add food markers if available
+    if _filtered_food is not None and not _filtered_food.empty:
         # Performance optimization: Use a single trace for vertical lines instead of many add_vline calls
         y_min = chart_df['glucose_mg_dl'].min()
         y_max = chart_df['glucose_mg_dl'].max()
+        food_x = epoch_ms(_filtered_food['timestamp'])
 
-        line_x = []
-        line_y = []
-        for ts in filtered_food['timestamp']:
-            line_x.extend([ts, ts, None])
-            line_y.extend([y_min, y_max, None])
+        # One trace for both the dotted lines and the hover markers: each food is a
+        # (bottom, marker, gap) triple, the NaN y breaking the line between foods.
+        # The bottom vertex gets a zero-size marker, and both vertices carry the
+        # food's name so hovering either one shows the same label.
+        line_x = np.repeat(food_x, 3)
+        line_y = np.tile(np.array([y_min, y_max + 5, np.nan], dtype=np.float32), len(food_x))
+        food_names = _filtered_food['food_name'].to_numpy(dtype=object)
 
         fig.add_trace(
             go.Scattergl(
                 x=line_x,
                 y=line_y,
-                mode='lines',
-                line=dict(color='green', width=1, dash='dot'),
-                opacity=0.2,
-                showlegend=False,
-                hoverinfo='skip'
+                mode='lines+markers',
+                name='Foods',
+                line=dict(color='rgba(0, 128, 0, 0.2)', width=1, dash='dot'),
+                marker=dict(color='green', size=np.tile(np.array([0, 8, 0], dtype=np.int8), len(food_x)), symbol='triangle-down'),
+                text=np.column_stack([food_names, food_names, np.full(len(food_names), '', dtype=object)]).ravel().tolist(),
+                hovertemplate='%{x|%I:%M %p}<br>%{text}<extra></extra>'
             ),
             row=1, col=1
         )
 
-        # Add scatter markers at top for food names on hover
+    # Velocity trace
+    if 'velocity_smoothed' in chart_df.columns:
         fig.add_trace(
             go.Scattergl(
-                x=filtered_food['timestamp'],
-                y=[y_max + 5] * len(filtered_food),
-                mode='markers',
-                name='Foods',
-                marker=dict(color='green', size=8, symbol='triangle-down'),
-                text=filtered_food['food_name'],
-                hovertemplate='%{x|%I:%M %p}<br>%{text}<extra></extra>'
+                x=chart_x,
+                y=chart_df['velocity_smoothed'].to_numpy(dtype=np.float32),
+                mode='lines',
+                name='Velocity',
+                line=dict(color='purple', width=1.5),
+                hovertemplate='%{x|%b %d, %I:%M %p}<br>Velocity: %{y:.2f} mg/dL/min<extra></extra>'
             ),
-            row=1, col=1
+            row=2, col=1
         )
 
-# Velocity trace
-if 'velocity_smoothed' in chart_df.columns:
-    fig.add_trace(
-        go.Scattergl(
-            x=chart_df['timestamp'],
-            y=chart_df['velocity_smoothed'],
-            mode='lines',
-            name='Velocity',
-            line=dict(color='purple', width=1.5),
-            hovertemplate='%{x|%b %d, %I:%M %p}<br>Velocity: %{y:.2f} mg/dL/min<extra></extra>'
-        ),
-        row=2, col=1
+        # Danger zone threshold
+        fig.add_hline(y=-DANGER_ZONE_THRESHOLD, line_dash="dash", line_color="red", row=2, col=1)
+        fig.add_hline(y=0, line_dash="solid", line_color="gray", opacity=0.3, row=2, col=1)
+
+    fig.update_layout(
+        height=600,
+        showlegend=True,
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
+        hovermode='x unified'
     )
 
-    # Danger zone threshold
-    fig.add_hline(y=-DANGER_ZONE_THRESHOLD, line_dash="dash", line_color="red", row=2, col=1)
-    fig.add_hline(y=0, line_dash="solid", line_color="gray", opacity=0.3, row=2, col=1)
+    fig.update_yaxes(title_text="mg/dL", row=1, col=1)
+    fig.update_yaxes(title_text="mg/dL/min", row=2, col=1)
+    fig.update_xaxes(title_text="Time", row=2, col=1, tickformat='%I:%M %p')  # 12-hour format
+    # The traces' x values are epoch milliseconds, so the axis type can't be inferred
+    fig.update_xaxes(type='date')
 
-fig.update_layout(
-    height=600,
-    showlegend=True,
-    legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
-    hovermode='x unified'
-)
+    return fig
 
-fig.update_yaxes(title_text="mg/dL", row=1, col=1)
-fig.update_yaxes(title_text="mg/dL/min", row=2, col=1)
-fig.update_xaxes(title_text="Time", row=2, col=1, tickformat='%I:%M %p')  # 12-hour format
 
-st.plotly_chart(fig, width="stretch")
+crash_windows = tuple(
+    (crash['start_time'], crash['end_time'])
+    for crash in (crash_events or [])[crash_lo:crash_hi]
+)
+st.plotly_chart(build_glucose_chart(range_key, filtered_glucose, filtered_food, crash_windows), width="stretch")
 
 # Meal Response Assessment section
-if food_df is not None and not food_df.empty:
-    st.divider()
-    st.subheader("🍽️ Meal Response Assessment")
-
-    # Group foods into meals (by Day + Group)
-    meals_df = group_foods_into_meals(food_df)
-
-    if not meals_df.empty:
-        # Merge meals with glucose data
-        merged_meals = merge_meals_with_glucose(filtered_glucose, meals_df)
-
-        if not merged_meals.empty:
-            # Load existing AI assessments from database (cached for this render)
-            if 'ai_assessments_cache' not in st.session_state:
-                st.session_state['ai_assessments_cache'] = get_all_meal_ai_assessments()
-            ai_assessments = st.session_state['ai_assessments_cache']
-
-            # Filter by date range
-            merged_meals['meal_time'] = pd.to_datetime(merged_meals['meal_time'])
-            meal_mask = (merged_meals['meal_time'].dt.date >= start_date) & (merged_meals['meal_time'].dt.date <= end_date)
-            filtered_meals = merged_meals[meal_mask]
+@st.fragment
+def meal_response_section(range_key: tuple, filtered_glucose: pd.DataFrame, food_df: pd.DataFrame | None, filtered_food: pd.DataFrame | None):
+    """
+    Meal list with its filter/sort controls and expanders.
+
+    Runs as a fragment so changing a filter or opening a meal reruns only this
+    section, not the main chart and crash analysis.
+    """
+    if food_df is not None and not food_df.empty:
+        st.divider()
+        st.subheader("🍽️ Meal Response Assessment")
+
+        # Group the range's foods into meals (by Day + Group); meals never span days,
+        # so this matches grouping every food and then filtering the meals by date
+        meals_df = get_cached_meals(range_key[1], filtered_food)
+
+        if not meals_df.empty:
+            # Merge meals with glucose data
+            filtered_meals = get_cached_merged_meals(range_key, filtered_glucose, filtered_food)
 
             if not filtered_meals.empty:
-                # Pre-calculate analysis for all meals (required for sorting/filtering)
-                meal_analyses = {}
-                for idx, meal in filtered_meals.iterrows():
-                    glucose_readings = meal.get('glucose_readings', [])
-                    has_any_data = len(glucose_readings) > 0
-                    analysis = analyze_meal_response(meal.to_dict()) if has_any_data else {}
-
-                    # Store analysis and basic stats
-                    analysis['has_any_data'] = has_any_data
-
-                    # Risk Level (Refined logic: Issues show even if partial)
-                    data_complete = meal.get('data_complete', True)
-
-                    if not has_any_data:
-                        risk = "Awaiting Data"
-                    else:
-                        m_rise_v = analysis.get('max_rise_velocity', 0)
-                        m_rise_d = analysis.get('glucose_rise', 0)
-                        m_peak = analysis.get('peak_glucose', 0)
-                        m_drop_v = abs(analysis.get('max_drop_velocity', 0))
-                        m_floor = analysis.get('min_glucose', 100)
-
-                        is_bad = (m_rise_v > 2.5 or m_rise_d > 50 or m_peak > 140 or m_drop_v > 1.5 or m_floor < 65)
-                        is_normal = (
-                            (1.5 <= m_rise_v <= 2.5) or
-                            (30 <= m_rise_d <= 50) or
-                            (120 <= m_peak <= 140) or
-                            (1.0 <= m_drop_v <= 1.5) or
-                            (65 <= m_floor <= 75)
-                        )
-
-                        if is_bad:
-                            risk = "Reactive"
-                        elif not data_complete:
-                            risk = "Partial Data"
-                        elif is_normal:
-                            risk = "Normal"
-                        else:
-                            risk = "Great"
-
-                    analysis['risk_category'] = risk
-                    analysis['data_complete'] = data_complete
-                    meal_analyses[idx] = analysis
+                # Load which meals have AI assessments (shared across sessions); the text
+                # itself is fetched when a meal's expander is opened
+                report_failed_ai_saves()
+                ai_keys = get_shared_ai_assessment_keys()
+
+                # Pre-calculate analysis for all meals in one vectorized pass (required for sorting/filtering)
+                # Meals without readings carry an empty glucose_readings dict
+                has_data = filtered_meals['glucose_readings'].map(bool)
+                # Per-meal dicts are only built for open expanders (see meal_analysis)
+                meal_responses = get_cached_meal_responses(range_key, filtered_glucose, filtered_food)
+                meal_stats = meal_responses.reindex(index=filtered_meals.index, columns=[
+                    'max_rise_velocity', 'glucose_rise', 'peak_glucose', 'max_drop_velocity', 'min_glucose',
+                    'time_to_peak_minutes', 'drop_duration_minutes', 'total_drop'
+                ]).astype(float)
+
+                # Risk Level (Refined logic: Issues show even if partial)
+                m_rise_v = meal_stats['max_rise_velocity']
+                m_rise_d = meal_stats['glucose_rise']
+                m_peak = meal_stats['peak_glucose']
+                m_drop_v = meal_stats['max_drop_velocity'].abs()
+                m_floor = meal_stats['min_glucose']
+
+                is_bad = (m_rise_v > 2.5) | (m_rise_d > 50) | (m_peak > 140) | (m_drop_v > 1.5) | (m_floor < 65)
+                is_normal = (
+                    m_rise_v.between(1.5, 2.5) |
+                    m_rise_d.between(30, 50) |
+                    m_peak.between(120, 140) |
+                    m_drop_v.between(1.0, 1.5) |
+                    m_floor.between(65, 75)
+                )
+                data_complete = filtered_meals['data_complete'].astype(bool)
+                # Classified as int8 codes so counting and filtering compare small ints, not strings
+                risk_codes = np.select(
+                    [~has_data, is_bad, ~data_complete, is_normal],
+                    [RISK_CATEGORIES.index(category) for category in ("Awaiting Data", "Reactive", "Partial Data", "Normal")],
+                    default=RISK_CATEGORIES.index("Great")
+                ).astype(np.int8)
+                risk_category = np.asarray(RISK_CATEGORIES, dtype=object)[risk_codes]
 
                 # Sorting and Filtering UI
                 st.markdown("##### 🔍 Filter & Sort Meals")
 
-# Pre-calculate counts for each risk category
-                risk_counts = {
-                    "Great": sum(1 for a in meal_analyses.values() if a['risk_category'] == "Great"),
-                    "Normal": sum(1 for a in meal_analyses.values() if a['risk_category'] == "Normal"),
-                    "Reactive": sum(1 for a in meal_analyses.values() if a['risk_category'] == "Reactive"),
-                    "Partial Data": sum(1 for a in meal_analyses.values() if a['risk_category'] == "Partial Data"),
-                    "Awaiting Data": sum(1 for a in meal_analyses.values() if a['risk_category'] == "Awaiting Data"),
-                }
+                # Pre-calculate counts for each risk category
+                risk_counts = dict(zip(RISK_CATEGORIES, np.bincount(risk_codes, minlength=len(RISK_CATEGORIES)).tolist()))
 
                 # Risk level checkboxes
                 st.markdown("**Risk Level Filters:**")
@@ -479,17 +974,22 @@ if food_df is not None and not food_df.empty:
                     with acol3:
                         drop_limit = st.slider("Min Drop Duration (min)", 0, 180, 0)
 
-                # Add helper columns for filtering/sorting
-                df_to_sort = filtered_meals.copy()
-                df_to_sort['risk_category'] = [meal_analyses[i]['risk_category'] for i in df_to_sort.index]
-                df_to_sort['v_abs'] = [abs(meal_analyses[i].get('max_drop_velocity') or 0) for i in df_to_sort.index]
-                df_to_sort['rise_dur'] = [meal_analyses[i].get('time_to_peak_minutes') or 0 for i in df_to_sort.index]
-                df_to_sort['drop_dur'] = [meal_analyses[i].get('drop_duration_minutes') or 0 for i in df_to_sort.index]
-                df_to_sort['rise_mag'] = [meal_analyses[i].get('glucose_rise') or 0 for i in df_to_sort.index]
-                df_to_sort['drop_mag'] = [meal_analyses[i].get('total_drop') or 0 for i in df_to_sort.index]
+                # Add helper columns for filtering/sorting (meals without readings count as 0)
+                no_data = ~has_data
+                # Joined in one concat rather than a copy plus one insert per column
+                df_to_sort = pd.concat([filtered_meals, pd.DataFrame({
+                    'has_any_data': has_data,
+                    'risk_category': risk_category,
+                    'v_abs': m_drop_v.mask(no_data, 0),
+                    'rise_dur': meal_stats['time_to_peak_minutes'].mask(no_data, 0),
+                    'drop_dur': meal_stats['drop_duration_minutes'].mask(no_data, 0),
+                    'rise_mag': m_rise_d.mask(no_data, 0),
+                    'drop_mag': meal_stats['total_drop'].mask(no_data, 0),
+                }, index=filtered_meals.index)], axis=1)
 
                 # Apply Filters
-                mask = df_to_sort['risk_category'].isin(selected_risks)
+                selected_codes = np.array([RISK_CATEGORIES.index(risk) for risk in selected_risks], dtype=np.int8)
+                mask = pd.Series(np.isin(risk_codes, selected_codes), index=df_to_sort.index)
                 mask &= df_to_sort['v_abs'] >= v_limit
                 mask &= df_to_sort['rise_dur'] >= rise_limit
                 mask &= df_to_sort['drop_dur'] >= drop_limit
@@ -512,76 +1012,115 @@ if food_df is not None and not food_df.empty:
                 if display_meals.empty:
                     st.info("No meals match the selected filters.")
                 else:
-                    # Meal group icons
-                    MEAL_ICONS = {
-                        'Breakfast': '🌅',
-                        'Lunch': '☀️',
-                        'Dinner': '🌙',
-                        'Snack': '🍎',
-                        'Snack 1': '🍎',
-                        'Snack 2': '🍎',
-                        'Snack 3': '🍎',
-                    }
-                    DEFAULT_MEAL_ICON = '🍽️'
+                    # Only one page of meals gets labels and expanders on each run
+                    n_pages = (len(display_meals) + MEALS_PER_PAGE - 1) // MEALS_PER_PAGE
+                    if n_pages > 1:
+                        # Filters can leave fewer pages than the one last shown
+                        if st.session_state.get('meal_page', 1) > n_pages:
+                            st.session_state['meal_page'] = n_pages
+                        pcol1, pcol2 = st.columns([1, 3])
+                        with pcol1:
+                            page = st.number_input(f"Page (of {n_pages})", min_value=1, max_value=n_pages, step=1, key='meal_page')
+                        first = (page - 1) * MEALS_PER_PAGE
+                        with pcol2:
+                            st.caption(f"Showing meals {first + 1}–{min(first + MEALS_PER_PAGE, len(display_meals))} of {len(display_meals)}")
+                        display_meals = display_meals.iloc[first:first + MEALS_PER_PAGE].copy()
+
+                    # Expander labels for every meal on the page in one vectorized pass each
+                    meal_times = display_meals['meal_time']
+                    display_meals['meal_key'] = meal_times.dt.strftime('%Y-%m-%d') + "_" + display_meals['group'].astype(str)
+                    display_meals['date_heading'] = meal_times.dt.strftime('%A, %B %d, %Y')
+                    display_meals['date_display'] = meal_times.dt.strftime('%a, %b %d')
+                    display_meals['time_display'] = meal_times.dt.strftime('%I:%M %p').str.lstrip('0')  # 12-hour format, strip leading zero
+                    # One icon lookup per meal group, then indexed by the categorical codes
+                    meal_groups = display_meals['group'].astype('category')
+                    group_icons = np.array([MEAL_ICONS.get(group, DEFAULT_MEAL_ICON) for group in meal_groups.cat.categories], dtype=object)
+                    display_meals['meal_icon'] = group_icons[meal_groups.cat.codes.to_numpy()]
+                    display_meals['risk_emoji'] = display_meals['risk_category'].map(RISK_EMOJIS).fillna(DEFAULT_RISK_EMOJI)
+                    # Partial-data meals show how much of the 3-hour window has readings
+                    partial = display_meals['risk_category'] == "Partial Data"
+                    display_meals['risk_text'] = display_meals['risk_category'].mask(
+                        partial,
+                        "Partial (" + display_meals['data_coverage_minutes'].astype(float).astype(int).astype(str) + " min)"
+                    )
+                    # P:C ratio and fiber/sugar colors for the details block (0 when a meal has no carbs)
+                    carbs = display_meals['carbs_g'].to_numpy(dtype=float)
+                    protein = display_meals['protein_g'].to_numpy(dtype=float)
+                    display_meals['p_c_ratio'] = np.divide(protein, carbs, out=np.zeros(len(carbs)), where=carbs > 0)
+                    display_meals['fiber_color'] = ladder_colors(display_meals['fiber_g'], [2, 5], ("gray", "orange", "green"))
+                    display_meals['sugar_color'] = ladder_colors(display_meals['sugar_g'], [np.nextafter(5, np.inf), np.nextafter(15, np.inf)], ("green", "orange", "red"))
+
+                    # Macros for the AI payloads as Python floats, converted in one block
+                    # rather than one float() per macro per meal
+                    meal_macros = display_meals[list(MACRO_COLS)].to_numpy(dtype=float).tolist()
+
+                    # Meals on this page with readings but no AI assessment can be assessed
+                    # together, a few per Gemini request instead of one click and call each
+                    unassessed = [
+                        (meal, macros) for meal, macros in zip(display_meals.itertuples(), meal_macros)
+                        if meal.has_any_data and meal.meal_key not in ai_keys
+                    ]
+                    if unassessed:
+                        batch_slot = st.empty()
+                        if batch_slot.button(f"🤖 Generate AI Assessments for {len(unassessed)} meal(s) on this page", key="ai_batch_btn"):
+                            with st.spinner("Generating AI assessments..."):
+                                assessed = generate_ai_assessments([
+                                    meal_ai_payload(meal, macros, meal_analysis(meal_responses, meal.Index))
+                                    for meal, macros in unassessed
+                                ])
+                            if assessed == len(unassessed):
+                                batch_slot.success(f"✅ Generated {assessed} AI assessment(s).")
+                            else:
+                                batch_slot.warning(f"⚠️ Generated {assessed} of {len(unassessed)} AI assessments. Try again for the rest.")
 
                     current_date = None
 
-                    for idx, meal in display_meals.iterrows():
+                    for meal, macros in zip(display_meals.itertuples(), meal_macros):
                         # Add date heading when date changes (only if sorting by time)
-                        if sort_on == "Meal Time":
-                            meal_date = meal['meal_time'].date()
-                            if meal_date != current_date:
-                                current_date = meal_date
-                                st.markdown(f"### 📅 {meal_date.strftime('%A, %B %d, %Y')}")
-
-                        # Use pre-calculated analysis
-                        analysis = meal_analyses[idx]
-                        has_any_data = analysis['has_any_data']
-                        data_complete = analysis['data_complete']
-                        data_coverage_minutes = meal.get('data_coverage_minutes', 0)
-                        minutes_until_complete = meal.get('minutes_until_complete', 0)
-                        glucose_readings = meal.get('glucose_readings', [])
-
-                        meal_time = meal['meal_time']
-                        group_name = meal.get('group', 'Unknown')
-                        food_count = meal.get('food_count', 0)
-
-                        # Create unique meal key for database
-                        meal_key = f"{meal_time.strftime('%Y-%m-%d')}_{group_name}"
-
-                        # Extract stats from pre-calculated analysis
-                        max_drop_velocity = analysis.get('max_drop_velocity', 0)
-                        total_drop = analysis.get('total_drop', 0)
-                        drop_duration_minutes = analysis.get('drop_duration_minutes')
-
-                        # Determine risk level and color (using pre-calculated category)
-                        risk_text = analysis['risk_category']
-                        if risk_text == "Reactive":
-                            risk_emoji = "🔴"
-                        elif risk_text == "Normal":
-                            risk_emoji = "🟡"
-                        elif risk_text == "Great":
-                            risk_emoji = "🟢"
-                        elif risk_text == "Partial Data":
-                            risk_emoji = "🔄"
-                            risk_text = f"Partial ({int(data_coverage_minutes)} min)"
-                        elif risk_text == "Awaiting Data":
-                            risk_emoji = "⏳"
-                        else:
-                            risk_emoji = "⚪"
+                        if sort_on == "Meal Time" and meal.date_heading != current_date:
+                            current_date = meal.date_heading
+                            st.markdown(f"### 📅 {current_date}")
+
+                        has_any_data = meal.has_any_data
+                        data_complete = meal.data_complete
+                        data_coverage_minutes = meal.data_coverage_minutes
+                        minutes_until_complete = meal.minutes_until_complete
+                        glucose_readings = meal.glucose_readings
+
+                        group_name = meal.group
+                        food_count = meal.food_count
+
+                        # Unique meal key for database
+                        meal_key = meal.meal_key
+
+                        # Risk level (using pre-calculated category and emoji)
+                        risk_text = meal.risk_text
+                        risk_emoji = meal.risk_emoji
 
                         # Check if we have an AI assessment already
-                        existing_assessment = ai_assessments.get(meal_key)
-                        has_ai = existing_assessment is not None and existing_assessment.get('ai_assessment')
+                        has_ai = meal_key in ai_keys
                         ai_icon = "🤖" if has_ai else ""
 
-                        # Get meal group icon
-                        meal_icon = MEAL_ICONS.get(group_name, DEFAULT_MEAL_ICON)
-                        # Format date and time for the expander title
-                        meal_date_display = meal_time.strftime('%a, %b %d')
-                        meal_time_display = meal_time.strftime('%I:%M %p').lstrip('0')  # 12-hour format, strip leading zero
+                        meal_icon = meal.meal_icon
+                        # Formatted date and time for the expander title
+                        meal_date_display = meal.date_display
+                        meal_time_display = meal.time_display
+
+                        # Stateful expander (rerun on toggle) so a meal's contents are only built while it's open
+                        meal_expander = st.expander(
+                            f"{risk_emoji} {meal_date_display} • {meal_time_display} {meal_icon} {group_name} ({food_count} foods) - {risk_text} {ai_icon}",
+                            expanded=False,
+                            key=f"meal_expander_{meal_key}",
+                            on_change="rerun"
+                        )
+                        # Closed meals only need their header
+                        if not meal_expander.open:
+                            continue
+
+                        # Extract stats from the pre-calculated analysis
+                        analysis = meal_analysis(meal_responses, meal.Index)
 
-                        with st.expander(f"{risk_emoji} {meal_date_display} • {meal_time_display} {meal_icon} {group_name} ({food_count} foods) - {risk_text} {ai_icon}", expanded=False):
+                        with meal_expander:
                             # Show data status message for incomplete data
                             if not has_any_data:
                                 st.warning(f"⏳ No glucose data available yet. Sync your CGM to see response data.")
@@ -594,190 +1133,24 @@ if food_df is not None and not food_df.empty:
                                     time_str = f"{mins_left} min"
                                 st.info(f"🔄 Partial data: {int(data_coverage_minutes)} min of 180 min. Full data available in ~{time_str} after CGM sync.")
 
-                            # Show foods in this meal with timestamps in a grid
-                            foods_with_times = meal.get('foods_with_times', [])
-                            if foods_with_times:
-                                st.markdown("**🍽️ Foods in this meal:**")
-                                # Create grid with 3 columns
-                                food_cols = st.columns(3)
-                                for i, food_item in enumerate(foods_with_times):
-                                    with food_cols[i % 3]:
-                                        food_time = food_item['timestamp']
-                                        if hasattr(food_time, 'strftime'):
-                                            time_str = food_time.strftime('%I:%M %p').lstrip('0')
-                                        else:
-                                            time_str = str(food_time)
-                                        # Distinct colors for time and food, no bullets
-                                        st.markdown(f":gray[{time_str}] **{food_item['name']}**")
-                            else:
-                                # Fallback to simple list if no timestamps available
-                                foods_list = meal.get('foods', [])
-                                if foods_list:
-                                    st.markdown(f"**Foods:** {', '.join(foods_list)}")
-
-                            # Summary Statistics Row
-                            st.markdown("---")
-                            mcol1, mcol2, mcol3, mcol4 = st.columns(4)
-
-                            with mcol1:
-                                st.markdown("##### 📈 Rise Analysis")
-                                if has_any_data:
-                                    peak = analysis.get('peak_glucose') or 0
-                                    rise_delta = analysis.get('glucose_rise') or 0
-                                    rise_vel = analysis.get('max_rise_velocity') or 0
-                                    rise_dur = analysis.get('time_to_peak_minutes') or 0
-
-                                    peak_color = "red" if peak > 140 else "orange" if peak >= 120 else "green"
-                                    delta_color = "red" if rise_delta > 50 else "orange" if rise_delta >= 30 else "green"
-                                    vel_color = "red" if rise_vel > 2.5 else "orange" if rise_vel >= 1.5 else "green"
-
-                                    st.markdown(f"Peak: **:{peak_color}[{peak:.0f} mg/dL]**")
-                                    st.markdown(f"Rise Delta: **:{delta_color}[+{rise_delta:.0f} mg/dL]**")
-                                    st.markdown(f"Rise Velocity: **:{vel_color}[{rise_vel:.2f} mg/dL/min]**")
-                                    st.markdown(f"Duration: **{rise_dur:.0f} min**")
-                                else:
-                                    st.markdown("No data available")
-
-                            with mcol2:
-                                st.markdown("##### 📉 Drop Analysis")
-                                if has_any_data:
-                                    floor = analysis.get('min_glucose') or 0
-                                    drop_vel = abs(analysis.get('max_drop_velocity') or 0)
-                                    total_drop = analysis.get('total_drop') or 0
-                                    drop_dur = analysis.get('drop_duration_minutes') or 0
-
-                                    floor_color = "red" if floor < 65 else "orange" if floor <= 75 else "green"
-                                    drop_vel_color = "red" if drop_vel > 1.5 else "orange" if drop_vel >= 1.0 else "green"
-
-                                    st.markdown(f"Min Floor: **:{floor_color}[{floor:.0f} mg/dL]**")
-                                    st.markdown(f"Max Drop Vel: **:{drop_vel_color}[{drop_vel:.2f} mg/dL/min]**")
-                                    st.markdown(f"Total Drop: **{total_drop:.0f} mg/dL**")
-                                    st.markdown(f"Duration: **{drop_dur:.0f} min**")
-                                else:
-                                    st.markdown("No data available")
-
-                            with mcol3:
-                                st.markdown("##### 🍎 Macros")
-                                st.markdown(f"Carbs: **{meal.get('carbs_g', 0):.1f}g**")
-                                st.markdown(f"Protein: **{meal.get('protein_g', 0):.1f}g**")
-                                st.markdown(f"Fat: **{meal.get('fat_g', 0):.1f}g**")
-                                st.markdown(f"Calories: **{meal.get('calories', 0):.0f} kcal**")
-
-                            with mcol4:
-                                st.markdown("##### 📊 Ratios & More")
-                                carbs = meal.get('carbs_g', 0)
-                                protein = meal.get('protein_g', 0)
-                                fiber = meal.get('fiber_g', 0)
-                                sugar = meal.get('sugar_g', 0)
-                                p_c_ratio = protein / carbs if carbs > 0 else 0
-
-                                fiber_color = "green" if fiber >= 5 else "orange" if fiber >= 2 else "gray"
-                                sugar_color = "red" if sugar > 15 else "orange" if sugar > 5 else "green"
-
-                                st.markdown(f"P:C Ratio: **{p_c_ratio:.2f}**")
-                                st.markdown(f"Fiber: **:{fiber_color}[{fiber:.1f}g]**")
-                                st.markdown(f"Sugar: **:{sugar_color}[{sugar:.1f}g]**")
-                                st.markdown(f"Food Items: **{food_count}**")
+                            # Foods grid and summary statistics as one HTML block instead of ~30 widgets
+                            st.html(meal_details_html(meal, analysis, has_any_data))
 
                             # AI Assessment Section (only show if we have glucose data)
                             if has_any_data:
                                 st.divider()
-                                if has_ai:
-                                    st.markdown("### 🤖 AI Assessment")
-                                    st.markdown(existing_assessment.get('ai_assessment', ''))
-                                else:
-                                    # Button to generate AI assessment
-                                    if st.button(f"🤖 Generate AI Assessment", key=f"ai_btn_{meal_key}"):
-                                        with st.spinner("Generating AI assessment..."):
-                                            # Get foods list for AI
-                                            foods_for_ai = meal.get('foods', [])
-                                            # Prepare meal data for AI
-                                            meal_data_for_ai = {
-                                                'meal_key': meal_key,
-                                                'meal_time': meal_time.isoformat(),
-                                                'group_name': group_name,
-                                                'foods': foods_for_ai,
-                                                'carbs_g': float(meal.get('carbs_g', 0)),
-                                                'protein_g': float(meal.get('protein_g', 0)),
-                                                'fat_g': float(meal.get('fat_g', 0)),
-                                                'fiber_g': float(meal.get('fiber_g', 0)),
-                                                'sugar_g': float(meal.get('sugar_g', 0)),
-                                                'baseline_glucose': float(analysis.get('baseline_glucose', 0)),
-                                                'peak_glucose': float(analysis.get('peak_glucose', 0)),
-                                                'glucose_rise': float(analysis.get('glucose_rise', 0)),
-                                                'max_drop_velocity': float(max_drop_velocity),
-                                                'total_drop': float(total_drop),
-                                                'crash_detected': analysis.get('crash_detected', False),
-                                            }
-
-                                            # Call Gemini API
-                                            ai_text = analyze_meal_with_ai(meal_data_for_ai)
-                                            meal_data_for_ai['ai_assessment'] = ai_text
-
-                                            # Save to database
-                                            if save_meal_ai_assessment(meal_data_for_ai):
-                                                # Update cache and rerun
-                                                st.session_state['ai_assessments_cache'][meal_key] = meal_data_for_ai
-                                                st.success("AI assessment saved!")
-                                                st.rerun()
-                                            else:
-                                                # Still show the assessment even if save failed
-                                                st.warning("Could not save to database, but here's the assessment:")
-                                                st.markdown(ai_text)
+                                meal_ai_assessment(meal_ai_payload(meal, macros, analysis))
 
                             # Mini chart for this meal with velocity
                             if glucose_readings:
-                                meal_glucose_df = pd.DataFrame(glucose_readings)
-
-                                # Create subplot with glucose and velocity
-                                from plotly.subplots import make_subplots
-                                fig_meal = make_subplots(
-                                    rows=2, cols=1,
-                                    shared_xaxes=True,
-                                    vertical_spacing=0.1,
-                                    row_heights=[0.7, 0.3],
-                                    subplot_titles=(f"Glucose Response: {group_name}", "Velocity (mg/dL/min)")
-                                )
-
-                                # Glucose trace - Use Scattergl
-                                fig_meal.add_trace(
-                                    go.Scattergl(
-                                        x=meal_glucose_df['minutes_from_meal'],
-                                        y=meal_glucose_df['glucose_mg_dl'],
-                                        mode='lines+markers',
-                                        name='Glucose',
-                                        line=dict(color='#1f77b4', width=2)
-                                    ),
-                                    row=1, col=1
-                                )
-                                fig_meal.add_hline(y=70, line_dash="dash", line_color="orange", opacity=0.5, row=1, col=1)
-                                fig_meal.add_hline(y=140, line_dash="dash", line_color="orange", opacity=0.5, row=1, col=1)
-
-                                # Velocity trace if available
-                                if 'velocity_smoothed' in meal_glucose_df.columns:
-                                    fig_meal.add_trace(
-                                        go.Scattergl(
-                                            x=meal_glucose_df['minutes_from_meal'],
-                                            y=meal_glucose_df['velocity_smoothed'],
-                                            mode='lines',
-                                            name='Velocity',
-                                            line=dict(color='purple', width=1.5)
-                                        ),
-                                        row=2, col=1
-                                    )
-                                    fig_meal.add_hline(y=-DANGER_ZONE_THRESHOLD, line_dash="dash", line_color="red", row=2, col=1)
-                                    fig_meal.add_hline(y=0, line_dash="solid", line_color="gray", opacity=0.3, row=2, col=1)
-
-                                fig_meal.update_xaxes(title_text="Minutes from Meal", row=2, col=1)
-                                fig_meal.update_yaxes(title_text="mg/dL", row=1, col=1)
-                                fig_meal.update_yaxes(title_text="mg/dL/min", row=2, col=1)
-                                st.plotly_chart(fig_meal, width="stretch")
+                                st.plotly_chart(build_meal_chart(group_name, glucose_readings), width="stretch")
             else:
-                st.info("No meals found in the selected date range.")
+                st.info("No glucose data matched with meals.")
         else:
-            st.info("No glucose data matched with meals.")
-    else:
-        st.info("Upload food data to see meal assessments.")
+            st.info("No meals found in the selected date range.")
+
+
+meal_response_section(range_key, filtered_glucose, food_df, filtered_food)
 
 # Crash analysis section
 if crash_events:
@@ -787,26 +1160,31 @@ if crash_events:
     col1, col2 = st.columns(2)
 
     with col1:
-        # Crash events table
+        # Crash events table, formatted column-wise (numpy's printf-style formatting
+        # rather than a Python lambda per cell)
         crash_df = pd.DataFrame(crash_events)
-        crash_df['start_time'] = pd.to_datetime(crash_df['start_time'])
-        crash_df_display = crash_df[['start_time', 'drop_magnitude', 'max_velocity', 'duration_minutes']].copy()
-        crash_df_display.columns = ['Time', 'Drop (mg/dL)', 'Max Velocity', 'Duration (min)']
-        crash_df_display['Time'] = crash_df_display['Time'].dt.strftime('%Y-%m-%d %I:%M %p')
-        crash_df_display['Max Velocity'] = crash_df_display['Max Velocity'].apply(lambda x: f"{abs(x):.2f}")
-        crash_df_display['Drop (mg/dL)'] = crash_df_display['Drop (mg/dL)'].apply(lambda x: f"{x:.1f}")
-        crash_df_display['Duration (min)'] = crash_df_display['Duration (min)'].apply(lambda x: f"{x:.0f}")
+        crash_df_display = pd.DataFrame({
+            'Time': pd.to_datetime(crash_df['start_time']).dt.strftime('%Y-%m-%d %I:%M %p'),
+            'Drop (mg/dL)': np.char.mod('%.1f', crash_df['drop_magnitude'].to_numpy(dtype=float)),
+            'Max Velocity': np.char.mod('%.2f', np.abs(crash_df['max_velocity'].to_numpy(dtype=float))),
+            'Duration (min)': np.char.mod('%.0f', crash_df['duration_minutes'].to_numpy(dtype=float)),
+        })
 
         st.dataframe(crash_df_display, width="stretch", hide_index=True)
 
     with col2:
-        # Crash distribution chart
-        fig_dist = px.histogram(
-            crash_df,
-            x='drop_magnitude',
-            nbins=10,
+        # Crash distribution chart, binned with numpy instead of a plotly.express histogram
+        counts, edges = np.histogram(crash_df['drop_magnitude'], bins=10)
+        fig_dist = go.Figure(go.Bar(
+            x=(edges[:-1] + edges[1:]) / 2,
+            y=counts,
+            width=np.diff(edges),
+            hovertemplate='Drop: %{x:.1f} mg/dL<br>Crashes: %{y}<extra></extra>'
+        ))
+        fig_dist.update_layout(
             title='Crash Magnitude Distribution',
-            labels={'drop_magnitude': 'Drop Magnitude (mg/dL)'}
+            xaxis_title='Drop Magnitude (mg/dL)',
+            yaxis_title='count'
         )
         st.plotly_chart(fig_dist, width="stretch")
 
@@ -818,37 +1196,42 @@ if food_df is not None and not food_df.empty and crash_events:
     col1, col2 = st.columns(2)
 
     with col1:
-        # Protein to Carb ratio analysis
-        food_df_analysis = food_df.copy()
-        food_df_analysis['protein_carb_ratio'] = food_df_analysis['protein_g'] / food_df_analysis['carbs_g'].replace(0, 1)
+        # plotly.express is only needed for this scatter
+        import plotly.express as px
 
+        # Protein to Carb ratio analysis, drawn with WebGL since every logged food is a point
         fig_ratio = px.scatter(
-            food_df_analysis,
+            food_df,
             x='carbs_g',
             y='protein_g',
             color='sugar_g',
             size='calories',
             hover_data=['food_name'],
             title='Protein vs Carbs (colored by Sugar)',
-            labels={'carbs_g': 'Carbs (g)', 'protein_g': 'Protein (g)', 'sugar_g': 'Sugar (g)'}
+            labels={'carbs_g': 'Carbs (g)', 'protein_g': 'Protein (g)', 'sugar_g': 'Sugar (g)'},
+            render_mode='webgl'
         )
         st.plotly_chart(fig_ratio, width="stretch")
 
     with col2:
-        # Daily macro breakdown
-        daily_macros = food_df.groupby(food_df['timestamp'].dt.date).agg({
-            'carbs_g': 'sum',
-            'protein_g': 'sum',
-            'fat_g': 'sum',
-            'fiber_g': 'sum'
-        }).reset_index()
-        daily_macros.columns = ['Date', 'Carbs', 'Protein', 'Fat', 'Fiber']
-
-        fig_macros = px.bar(
-            daily_macros,
-            x='Date',
-            y=['Carbs', 'Protein', 'Fat', 'Fiber'],
+        # Daily macro breakdown - one bincount per macro over the day codes instead of a groupby
+        days, day_index = np.unique(food_df['day_i8'].to_numpy(), return_inverse=True)
+        day_dates = days.astype('datetime64[D]')
+        macro_labels = {'carbs_g': 'Carbs', 'protein_g': 'Protein', 'fat_g': 'Fat', 'fiber_g': 'Fiber'}
+
+        fig_macros = go.Figure([
+            go.Bar(
+                x=day_dates,
+                # Missing values count as 0, like the groupby sum skipping NaN
+                y=np.bincount(day_index, weights=np.nan_to_num(food_df[col].to_numpy(dtype=float)), minlength=len(days)),
+                name=label
+            )
+            for col, label in macro_labels.items()
+        ])
+        fig_macros.update_layout(
             title='Daily Macro Breakdown',
+            xaxis_title='Date',
+            yaxis_title='Grams',
             barmode='group'
         )
         st.plotly_chart(fig_macros, width="stretch")
@@ -858,7 +1241,6 @@ with st.sidebar:
     st.header("📊 Quick Stats")
 
     if crash_events:
-        stats = get_crash_summary_stats(crash_events)
-        st.metric("Total Crashes", stats['total_crashes'])
-        st.metric("Avg Duration", f"{stats['avg_duration']:.0f} min")
-        st.metric("Worst Velocity", f"{abs(stats['worst_velocity']):.2f} mg/dL/min")
+        st.metric("Total Crashes", crash_stats['total_crashes'])
+        st.metric("Avg Duration", f"{crash_stats['avg_duration']:.0f} min")
+        st.metric("Worst Velocity", f"{abs(crash_stats['worst_velocity']):.2f} mg/dL/min")
@@ -2,7 +2,7 @@
 import streamlit as st
 import pandas as pd
 from datetime import datetime
-from services import analyze_crash_event, predict_crash_timing, analyze_symptom_mapping, chat_with_context
+from services import analyze_crash_event, predict_crash_timing, analyze_symptom_mapping, chat_with_context_stream
 from database import get_chat_history, save_chat_message, get_glucose_readings, get_food_logs
 from config import GEMINI_API_KEY
 
@@ -53,12 +53,11 @@ with st.sidebar:
                 food_context = None
                 if food_df is not None:
                     crash_time = selected_crash['start_time']
-                    # Find food eaten 30-180 min before crash
-                    for _, food in food_df.iterrows():
-                        time_diff = (crash_time - food['timestamp']).total_seconds() / 60
-                        if 30 <= time_diff <= 180:
-                            food_context = food.to_dict()
-                            break
+                    # Find the first food eaten 30-180 min before crash
+                    time_diff = (crash_time - food_df['timestamp']).dt.total_seconds() / 60
+                    in_window = time_diff.between(30, 180).to_numpy()
+                    if in_window.any():
+                        food_context = food_df.iloc[in_window.argmax()].to_dict()
 
                 with st.spinner("Analyzing crash event..."):
                     analysis = analyze_crash_event(selected_crash, food_context)
@@ -147,30 +146,29 @@ if prompt := st.chat_input("Ask me anything about your glucose data..."):
 
     # Generate response
     with st.chat_message("assistant"):
-        with st.spinner("Thinking..."):
-            # Prepare context
-            glucose_context = None
-            food_context = None
-
-            glucose_df = st.session_state.get('glucose_df')
-            if glucose_df is not None:
-                # Get last 24 hours of data for context
-                recent = glucose_df.tail(50)
-                glucose_context = recent[['timestamp', 'glucose_mg_dl']].to_string()
-
-            food_df = st.session_state.get('food_df')
-            if food_df is not None:
-                recent_food = food_df.tail(10)
-                food_context = recent_food[['timestamp', 'food_name', 'carbs_g', 'protein_g']].to_string()
-
-            response = chat_with_context(
-                prompt,
-                st.session_state.messages[:-1],  # Exclude current message
-                glucose_context,
-                food_context
-            )
-
-            st.markdown(response)
+        # Prepare context
+        glucose_context = None
+        food_context = None
+
+        glucose_df = st.session_state.get('glucose_df')
+        if glucose_df is not None:
+            # Get last 24 hours of data for context
+            recent = glucose_df.tail(50)
+            glucose_context = recent[['timestamp', 'glucose_mg_dl']].to_string()
+
+        food_df = st.session_state.get('food_df')
+        if food_df is not None:
+            recent_food = food_df.tail(10)
+            food_context = recent_food[['timestamp', 'food_name', 'carbs_g', 'protein_g']].to_string()
+
+        # Show the reply as Gemini generates it rather than behind a spinner;
+        # write_stream returns the full text for the history
+        response = st.write_stream(chat_with_context_stream(
+            prompt,
+            st.session_state.messages[:-1],  # Exclude current message
+            glucose_context,
+            food_context
+        ))
 
     # Add assistant response
     st.session_state.messages.append({"role": "assistant", "content": response})
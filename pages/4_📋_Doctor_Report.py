@@ -1,40 +1,92 @@
 """Doctor's Report Export page."""
 import streamlit as st
 import pandas as pd
+import numpy as np
 from datetime import datetime, timedelta
 from services import generate_doctor_report, save_report_to_file
-from utils import get_crash_summary_stats
-from database import get_crash_events, get_glucose_readings, get_food_logs
+from utils import get_crash_summary_stats, day_numbers
+from database import get_crash_events, detect_crashes_in_db, has_detect_crashes_function, get_glucose_readings_df, get_food_logs_df, get_table_fingerprint
 
 st.title("📋 Doctor's Note Export")
 st.markdown("Generate a professional PDF summary for your physician.")
 
+
+def absolute_times(timestamps: pd.Series) -> np.ndarray:
+    """Timestamps as datetime64[ns] for time arithmetic; tz-aware ones compare in UTC, like Timestamps do."""
+    timestamps = pd.to_datetime(timestamps)
+    if timestamps.dt.tz is not None:
+        timestamps = timestamps.dt.tz_convert(None)
+    return timestamps.to_numpy(dtype='datetime64[ns]')
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def get_data_fingerprint() -> tuple:
+    """
+    Where crashes come from, plus fingerprints of the tables the database fallbacks
+    read. Polled at most once a minute.
+
+    The cached loaders below take the fingerprints as arguments, so they reload
+    only after rows are added or corrected, whether by the upload page or auto-import.
+    """
+    glucose_fp = get_table_fingerprint("glucose_readings")
+    food_fp = get_table_fingerprint("food_logs")
+    # Crashes are derived from the readings when detect_crashes is deployed
+    use_detect_crashes = has_detect_crashes_function()
+    crash_fp = glucose_fp if use_detect_crashes else get_table_fingerprint("crash_events", "start_time")
+    return use_detect_crashes, glucose_fp, food_fp, crash_fp
+
+
+# Database fallbacks for sessions without uploaded data, cached so widget changes
+# don't refetch and reparse
+@st.cache_data(show_spinner="Fetching glucose data...", max_entries=2)
+def load_glucose_df(glucose_fingerprint: tuple) -> pd.DataFrame:
+    """Glucose readings from the database, with parsed timestamps."""
+    return get_glucose_readings_df()
+
+
+@st.cache_data(show_spinner="Fetching food logs...", max_entries=2)
+def load_food_df(food_fingerprint: tuple) -> pd.DataFrame:
+    """Food logs from the database, with parsed timestamps."""
+    return get_food_logs_df()
+
+
+@st.cache_data(show_spinner="Loading crash events...", max_entries=2)
+def load_crash_events(use_detect_crashes: bool, crash_fingerprint: tuple) -> list[dict]:
+    """Crash events from the database, with start/end times parsed to Timestamps."""
+    # Derive crashes from the stored readings in the database, where an empty result
+    # means no crashes; saved events are only read if detect_crashes isn't deployed,
+    # since uploads stop writing them once it is
+    if use_detect_crashes:
+        crash_data = detect_crashes_in_db()
+    else:
+        crash_data = get_crash_events()
+    if not crash_data:
+        return []
+    # Parse the ISO time strings a column at a time instead of per event
+    crash_df = pd.DataFrame(crash_data)
+    for key in ['start_time', 'end_time']:
+        if key in crash_df.columns:
+            crash_df[key] = pd.to_datetime(crash_df[key])
+    return crash_df.to_dict('records')
+
+
 # Get data
 glucose_df = st.session_state.get('glucose_df')
 crash_events = st.session_state.get('crash_events', [])
 food_df = st.session_state.get('food_df')
 
 # Load from database if not in session
-if glucose_df is None:
-    glucose_data = get_glucose_readings()
-    if glucose_data:
-        glucose_df = pd.DataFrame(glucose_data)
-        glucose_df['timestamp'] = pd.to_datetime(glucose_df['timestamp'])
-
-if not crash_events:
-    crash_data = get_crash_events()
-    if crash_data:
-        crash_events = crash_data
-        for event in crash_events:
-            for key in ['start_time', 'end_time']:
-                if key in event and isinstance(event[key], str):
-                    event[key] = pd.to_datetime(event[key])
-
-if food_df is None:
-    food_data = get_food_logs()
-    if food_data:
-        food_df = pd.DataFrame(food_data)
-        food_df['timestamp'] = pd.to_datetime(food_df['timestamp'])
+if glucose_df is None or not crash_events or food_df is None:
+    use_detect_crashes, glucose_fp, food_fp, crash_fp = get_data_fingerprint()
+
+    if glucose_df is None:
+        glucose_df = load_glucose_df(glucose_fp)
+
+    if not crash_events:
+        crash_events = load_crash_events(use_detect_crashes, crash_fp)
+
+    if food_df is None:
+        food_df = load_food_df(food_fp)
 
 # Check if we have data
 if glucose_df is None or glucose_df.empty:
@@ -70,17 +122,19 @@ with col2:
 st.divider()
 st.subheader("📊 Report Preview")
 
-# Filter data by date range
-mask = (glucose_df['timestamp'].dt.date >= report_start) & (glucose_df['timestamp'].dt.date <= report_end)
+# Filter data by date range, comparing int64 day numbers rather than building a date object per reading
+start_day = np.datetime64(report_start, 'D').astype(np.int64)
+end_day = np.datetime64(report_end, 'D').astype(np.int64)
+glucose_days = day_numbers(glucose_df['timestamp'])
+mask = (glucose_days >= start_day) & (glucose_days <= end_day)
 filtered_glucose = glucose_df[mask]
 
-# Filter crash events
+# Filter crash events by start day the same way, parsing any time strings in one call
 filtered_crashes = []
 if crash_events:
-    for crash in crash_events:
-        crash_date = crash['start_time'].date() if hasattr(crash['start_time'], 'date') else pd.to_datetime(crash['start_time']).date()
-        if report_start <= crash_date <= report_end:
-            filtered_crashes.append(crash)
+    crash_days = day_numbers(pd.to_datetime(pd.Series([crash['start_time'] for crash in crash_events])))
+    in_range = np.flatnonzero((crash_days >= start_day) & (crash_days <= end_day))
+    filtered_crashes = [crash_events[i] for i in in_range]
 
 # Summary stats
 stats = get_crash_summary_stats(filtered_crashes)
@@ -121,30 +175,31 @@ else:
 if food_df is not None and not food_df.empty and filtered_crashes:
     st.markdown("### 🍽️ Potential Food Triggers")
 
-    # Simple trigger analysis - foods eaten before crashes
-    food_triggers = []
-
-    for crash in filtered_crashes:
-        crash_time = crash['start_time']
-        if isinstance(crash_time, str):
-            crash_time = pd.to_datetime(crash_time)
-
-        # Look for foods 30-180 min before crash
-        for _, food in food_df.iterrows():
-            food_time = food['timestamp']
-            if isinstance(food_time, str):
-                food_time = pd.to_datetime(food_time)
-
-            time_diff = (crash_time - food_time).total_seconds() / 60
-            if 30 <= time_diff <= 180:
-                food_triggers.append({
-                    'food_name': food.get('food_name', 'Unknown'),
-                    'crash_velocity': crash.get('max_velocity', 0)
-                })
-
-    if food_triggers:
+    # Simple trigger analysis - foods eaten 30-180 min before each crash. Each crash's
+    # window is a slice of the time-sorted food logs, found by binary search instead
+    # of scanning every food for every crash.
+    food_times = absolute_times(food_df['timestamp'])
+    logged = np.flatnonzero(~np.isnat(food_times))
+    by_time = logged[np.argsort(food_times[logged], kind='stable')]
+    sorted_times = food_times[by_time]
+
+    crash_times = absolute_times(pd.Series([crash['start_time'] for crash in filtered_crashes]))
+    lo = np.searchsorted(sorted_times, crash_times - np.timedelta64(180, 'm'), side='left')
+    hi = np.searchsorted(sorted_times, crash_times - np.timedelta64(30, 'm'), side='right')
+
+    # One (crash, food) pair per match, ordered by crash and then food log row
+    counts = hi - lo
+    crash_idx = np.repeat(np.arange(len(filtered_crashes)), counts)
+    food_idx = by_time[np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts - lo, counts)]
+    pair_order = np.lexsort((food_idx, crash_idx))
+    crash_idx, food_idx = crash_idx[pair_order], food_idx[pair_order]
+
+    food_names = food_df['food_name'].to_numpy(dtype=object) if 'food_name' in food_df.columns else np.full(len(food_df), 'Unknown', dtype=object)
+    crash_velocities = np.array([crash.get('max_velocity', 0) for crash in filtered_crashes], dtype=float)
+
+    if len(food_idx):
         # Aggregate by food
-        trigger_df = pd.DataFrame(food_triggers)
+        trigger_df = pd.DataFrame({'food_name': food_names[food_idx], 'crash_velocity': crash_velocities[crash_idx]})
         trigger_summary = trigger_df.groupby('food_name').agg({
             'crash_velocity': ['count', 'mean']
         }).reset_index()
@@ -4,6 +4,7 @@ from .gemini_service import (
     predict_crash_timing,
     analyze_symptom_mapping,
     chat_with_context,
+    chat_with_context_stream,
 )
 from .pdf_generator import generate_doctor_report, save_report_to_file
 
@@ -12,6 +13,7 @@ __all__ = [
     "predict_crash_timing",
     "analyze_symptom_mapping",
     "chat_with_context",
+    "chat_with_context_stream",
     "generate_doctor_report",
     "save_report_to_file",
 ]
@@ -1,4 +1,6 @@
 """Gemini AI integration for analysis and chat."""
+import re
+from collections.abc import Iterator
 import google.generativeai as genai
 from config import GEMINI_API_KEY
 import pandas as pd
@@ -19,26 +21,12 @@ def get_gemini_model():
     return genai.GenerativeModel('gemini-2.0-flash')
 
 
-def analyze_meal_with_ai(meal_data: dict) -> str:
-    """
-    Generate an AI assessment of a meal's glucose response.
-
-    Args:
-        meal_data: Dict with meal details and glucose response metrics
-
-    Returns:
-        AI-generated assessment text
-    """
-    model = get_gemini_model()
-    if not model:
-        return "Gemini API not configured. Please add your API key to .env"
-
+def _meal_details(meal_data: dict) -> str:
+    """Meal, macro and glucose response sections of a meal assessment prompt."""
     foods = meal_data.get('foods', [])
     foods_str = ', '.join(foods) if foods else 'Unknown'
 
-    prompt = f"""You are a nutrition and glucose metabolism expert. Analyze this meal's glucose response:
-
-## Meal Details:
+    return f"""## Meal Details:
 - Meal: {meal_data.get('group_name', 'Unknown')}
 - Foods: {foods_str}
 - Time: {meal_data.get('meal_time', 'Unknown')}
@@ -56,7 +44,26 @@ def analyze_meal_with_ai(meal_data: dict) -> str:
 - Rise: {meal_data.get('glucose_rise', 'N/A')} mg/dL
 - Max Drop Velocity: {meal_data.get('max_drop_velocity', 'N/A')} mg/dL/min
 - Total Drop from Peak: {meal_data.get('total_drop', 'N/A')} mg/dL
-- Crash Detected: {'Yes' if meal_data.get('crash_detected', False) else 'No'}
+- Crash Detected: {'Yes' if meal_data.get('crash_detected', False) else 'No'}"""
+
+
+def analyze_meal_with_ai(meal_data: dict) -> str:
+    """
+    Generate an AI assessment of a meal's glucose response.
+
+    Args:
+        meal_data: Dict with meal details and glucose response metrics
+
+    Returns:
+        AI-generated assessment text
+    """
+    model = get_gemini_model()
+    if not model:
+        return "Gemini API not configured. Please add your API key to .env"
+
+    prompt = f"""You are a nutrition and glucose metabolism expert. Analyze this meal's glucose response:
+
+{_meal_details(meal_data)}
 
 Please provide a concise assessment (2-3 paragraphs) covering:
 1. How well the meal composition supported stable glucose
@@ -72,6 +79,59 @@ Focus on actionable insights. Be encouraging but honest."""
         return f"Error generating analysis: {e}"
 
 
+def analyze_meals_batch(meal_dicts: list[dict]) -> list[str | None]:
+    """
+    Generate AI assessments for several meals in one Gemini request.
+
+    The instructions are sent once for all meals and the reply is split on its
+    "### Meal N" headings, so N meals cost one round trip instead of N.
+
+    Args:
+        meal_dicts: Dicts with meal details and glucose response metrics, as
+            passed to analyze_meal_with_ai
+
+    Returns:
+        One assessment per meal, in order; None for meals the reply had no
+        section for, or for every meal if the request failed
+    """
+    if not meal_dicts:
+        return []
+    model = get_gemini_model()
+    if not model:
+        return [None] * len(meal_dicts)
+
+    meals_str = "\n\n".join(
+        f"# Meal {i}\n{_meal_details(meal_data)}" for i, meal_data in enumerate(meal_dicts, start=1)
+    )
+
+    prompt = f"""You are a nutrition and glucose metabolism expert. Analyze the glucose response of each of these {len(meal_dicts)} meals:
+
+{meals_str}
+
+For each meal, please provide a concise assessment (2-3 paragraphs) covering:
+1. How well the meal composition supported stable glucose
+2. What likely caused the glucose pattern observed
+3. Specific suggestions to improve this meal for better glucose response
+
+Focus on actionable insights. Be encouraging but honest.
+
+Answer every meal in order. Start each meal's assessment with a line containing only "### Meal N", where N is its number above, and write nothing before the first one."""
+
+    try:
+        response = model.generate_content(prompt)
+        text = response.text
+    except Exception as e:
+        print(f"Error generating batch analysis: {e}")
+        return [None] * len(meal_dicts)
+
+    # re.split with a capture group alternates heading numbers and section bodies
+    parts = re.split(r'^[ \t]*#{1,6}[ \t]*\**Meal[ \t]+(\d+)\b.*$', text, flags=re.MULTILINE)
+    sections = {}
+    for number, body in zip(parts[1::2], parts[2::2]):
+        sections.setdefault(int(number), body.strip())
+    return [sections.get(i) or None for i in range(1, len(meal_dicts) + 1)]
+
+
 def analyze_crash_event(crash_event: dict, food_context: dict = None) -> str:
     """
     Ask Gemini to analyze why a crash happened.
@@ -208,19 +268,13 @@ Be empathetic but evidence-based in your response."""
         return f"Error generating analysis: {e}"
 
 
-def chat_with_context(
+def _chat_prompt(
     user_message: str,
     chat_history: list = None,
     glucose_context: str = None,
     food_context: str = None
 ) -> str:
-    """
-    General chat with Gemini including glucose/food context.
-    """
-    model = get_gemini_model()
-    if not model:
-        return "Gemini API not configured. Please add your API key to .env"
-
+    """Full chat prompt: system instructions, data context, recent history and the new message."""
     system_prompt = """You are a helpful AI assistant specialized in continuous glucose monitoring (CGM) data analysis and reactive hypoglycemia management. You have access to the user's glucose and food data.
 
 Key things to remember:
@@ -245,7 +299,7 @@ Key things to remember:
             content = msg.get('content', '')
             history_text += f"{role.upper()}: {content}\n"
 
-    full_prompt = f"""{system_prompt}
+    return f"""{system_prompt}
 {context}
 {history_text}
 
@@ -253,8 +307,52 @@ USER: {user_message}
 
 Please respond helpfully and concisely."""
 
+
+def chat_with_context(
+    user_message: str,
+    chat_history: list = None,
+    glucose_context: str = None,
+    food_context: str = None
+) -> str:
+    """
+    General chat with Gemini including glucose/food context.
+    """
+    model = get_gemini_model()
+    if not model:
+        return "Gemini API not configured. Please add your API key to .env"
+
+    full_prompt = _chat_prompt(user_message, chat_history, glucose_context, food_context)
+
     try:
         response = model.generate_content(full_prompt)
         return response.text
     except Exception as e:
         return f"Error generating response: {e}"
+
+
+def chat_with_context_stream(
+    user_message: str,
+    chat_history: list = None,
+    glucose_context: str = None,
+    food_context: str = None
+) -> Iterator[str]:
+    """
+    General chat with Gemini like chat_with_context, yielding the reply in chunks as it is generated.
+    """
+    model = get_gemini_model()
+    if not model:
+        yield "Gemini API not configured. Please add your API key to .env"
+        return
+
+    full_prompt = _chat_prompt(user_message, chat_history, glucose_context, food_context)
+
+    streamed = False
+    try:
+        for chunk in model.generate_content(full_prompt, stream=True):
+            yield chunk.text
+            streamed = True
+    except Exception as e:
+        if streamed:
+            # Start an error partway through the reply on its own paragraph
+            yield "\n\n"
+        yield f"Error generating response: {e}"
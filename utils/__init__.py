@@ -2,10 +2,15 @@
 from .csv_parser import parse_libre_csv, parse_cronometer_csv, group_foods_into_meals, merge_meals_with_glucose
 from .crash_analysis import (
     calculate_glucose_velocity,
+    downcast_glucose,
     detect_crash_events,
     analyze_meal_response,
+    analyze_meal_responses,
     get_crash_summary_stats,
 )
+from .downsampling import lttb_downsample, minmax_lttb_downsample
+from .dates import day_numbers
+from .save_records import glucose_save_records, food_save_frame, crash_save_records
 
 __all__ = [
     "parse_libre_csv",
@@ -13,7 +18,15 @@ __all__ = [
     "group_foods_into_meals",
     "merge_meals_with_glucose",
     "calculate_glucose_velocity",
+    "downcast_glucose",
     "detect_crash_events",
     "analyze_meal_response",
+    "analyze_meal_responses",
     "get_crash_summary_stats",
+    "lttb_downsample",
+    "minmax_lttb_downsample",
+    "day_numbers",
+    "glucose_save_records",
+    "food_save_frame",
+    "crash_save_records",
 ]
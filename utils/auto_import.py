@@ -3,7 +3,6 @@ import os
 import glob
 import pandas as pd
 import streamlit as st
-import numpy as np
 from datetime import datetime
 from config import DOWNLOADS_DIR, GLUCOSE_FILE_PATTERN, FOOD_FILE_PATTERN, AUTO_IMPORT_ENABLED
 from utils.csv_parser import (
@@ -14,14 +13,17 @@ from utils.csv_parser import (
 )
 from utils.crash_analysis import (
     calculate_glucose_velocity,
+    downcast_glucose,
     detect_crash_events
 )
+from utils.save_records import glucose_save_records, food_save_frame, crash_save_records
 from database import (
     save_glucose_readings,
     save_food_logs,
     save_crash_events,
-    is_file_already_imported,
-    record_imported_file,
+    has_detect_crashes_function,
+    filter_unimported,
+    record_imported_files,
     get_recently_imported_files
 )
 
@@ -72,24 +74,15 @@ def process_and_save_files(glucose_path: str | None, food_path: str | None):
     # Process Glucose
     if glucose_path:
         try:
-            with open(glucose_path, "r", encoding="utf-8") as f:
-                content = f.read()
-            glucose_df = parse_libre_csv(content)
+            with open(glucose_path, "rb") as f:
+                glucose_df = parse_libre_csv(f)
 
             # Save to DB immediately
             glucose_with_velocity = calculate_glucose_velocity(glucose_df)
             crash_events = detect_crash_events(glucose_with_velocity)
+            glucose_with_velocity = downcast_glucose(glucose_with_velocity)
 
-            glucose_schema_cols = ["timestamp", "glucose_mg_dl", "velocity", "velocity_smoothed", "is_danger_zone"]
-            glucose_cols = [c for c in glucose_schema_cols if c in glucose_with_velocity.columns]
-            glucose_clean = glucose_with_velocity[glucose_cols].replace({np.nan: None})
-            glucose_records = glucose_clean.to_dict("records")
-
-            for record in glucose_records:
-                if "timestamp" in record and record["timestamp"] is not None:
-                    record["timestamp"] = record["timestamp"].isoformat()
-
-            if save_glucose_readings(glucose_records):
+            if save_glucose_readings(glucose_save_records(glucose_with_velocity)):
                 results.append({
                     "type": "glucose",
                     "name": os.path.basename(glucose_path),
@@ -99,39 +92,19 @@ def process_and_save_files(glucose_path: str | None, food_path: str | None):
                 st.session_state['glucose_df'] = glucose_with_velocity
                 st.session_state['crash_events'] = crash_events
 
-                # Save crashes if any
-                if crash_events:
-                    crash_schema_cols = ['start_time', 'end_time', 'start_glucose', 'end_glucose', 'drop_magnitude', 'average_velocity', 'max_velocity', 'duration_minutes']
-                    crash_records = []
-                    for crash in crash_events:
-                        crash_record = {k: v for k, v in crash.items() if k in crash_schema_cols}
-                        for key in ['start_time', 'end_time']:
-                            if key in crash_record and hasattr(crash_record[key], 'isoformat'):
-                                crash_record[key] = crash_record[key].isoformat()
-                        crash_records.append(crash_record)
-                    save_crash_events(crash_records)
+                # Save crashes if any, unless the database detects them from the readings
+                if crash_events and not has_detect_crashes_function():
+                    save_crash_events(crash_save_records(crash_events))
         except Exception as e:
             st.error(f"Error parsing auto-imported glucose file: {e}")
 
     # Process Food
     if food_path:
         try:
-            with open(food_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            food_df = parse_cronometer_csv(content)
-
-            food_schema_cols = ['timestamp', 'food_name', 'group', 'calories', 'protein_g', 'carbs_g', 'fat_g', 'fiber_g', 'sugar_g']
-            food_cols = [c for c in food_schema_cols if c in food_df.columns]
-            food_clean = food_df[food_cols].replace({np.nan: None})
-            food_records = food_clean.to_dict('records')
-
-            for record in food_records:
-                if 'group' in record:
-                    record['meal_group'] = record.pop('group')
-                if 'timestamp' in record and record['timestamp'] is not None:
-                    record['timestamp'] = record['timestamp'].isoformat()
-
-            if save_food_logs(food_records):
+            with open(food_path, 'rb') as f:
+                food_df = parse_cronometer_csv(f)
+
+            if save_food_logs(food_save_frame(food_df)):
                 results.append({
                     'type': 'food',
                     'name': os.path.basename(food_path),
@@ -177,20 +150,17 @@ def check_and_perform_auto_import():
         glucose_file = get_latest_file(DOWNLOADS_DIR, GLUCOSE_FILE_PATTERN)
         food_file = get_latest_file(DOWNLOADS_DIR, FOOD_FILE_PATTERN)
 
-        files_to_import = []
-        if glucose_file:
-            mtime = os.path.getmtime(glucose_file)
-            if not is_file_already_imported(os.path.basename(glucose_file), mtime):
-                files_to_import.append(('glucose', glucose_file, mtime))
-            else:
-                pass
-
-        if food_file:
-            mtime = os.path.getmtime(food_file)
-            if not is_file_already_imported(os.path.basename(food_file), mtime):
-                files_to_import.append(('food', food_file, mtime))
-            else:
-                pass
+        candidates = [
+            (f_type, path, os.path.getmtime(path))
+            for f_type, path in (('glucose', glucose_file), ('food', food_file))
+            if path
+        ]
+        # Check all candidates against the database in one query
+        unimported = filter_unimported([(os.path.basename(path), mtime) for _, path, mtime in candidates])
+        files_to_import = [
+            (f_type, path, mtime) for f_type, path, mtime in candidates
+            if (os.path.basename(path), int(mtime * 1000)) in unimported
+        ]
 
         if files_to_import:
             status.update(label="🚀 Importing new data files...", state="running", expanded=True)
@@ -202,18 +172,16 @@ def check_and_perform_auto_import():
 
             if imported_results:
                 # Record in database only the ones that were successfully saved
-                recorded_count = 0
-                for result in imported_results:
+                imported_files = [
                     # Find the mtime from our files_to_import list
-                    mtime = next((mt for f_type, path, mt in files_to_import if f_type == result['type']), 0)
-                    if record_imported_file(result['name'], mtime, result['type']):
-                        recorded_count += 1
-                    else:
-                        pass
+                    (result['name'], next((mt for f_type, path, mt in files_to_import if f_type == result['type']), 0), result['type'])
+                    for result in imported_results
+                ]
+                recorded = record_imported_files(imported_files)
 
                 st.session_state['last_imported_files'] = imported_results
 
-                if recorded_count < len(imported_results):
+                if not recorded:
                     st.error("⚠️ Data was imported but the record could not be saved to the database.")
 
                 success_msg = "✅ Auto-imported data:\n"
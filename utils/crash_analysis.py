@@ -18,17 +18,22 @@ def calculate_glucose_velocity(glucose_df: pd.DataFrame, window_minutes: int = 1
     if glucose_df.empty:
         return glucose_df
 
-    df = glucose_df.copy()
-    df = df.sort_values('timestamp').reset_index(drop=True)
-
-    # Calculate time differences in minutes
-    df['time_diff_min'] = df['timestamp'].diff().dt.total_seconds() / 60
-
-    # Calculate glucose difference
-    df['glucose_diff'] = df['glucose_mg_dl'].diff()
-
-    # Calculate velocity (mg/dL per minute)
-    df['velocity'] = df['glucose_diff'] / df['time_diff_min']
+    # Exports and database reads are already in time order, so only sort when needed;
+    # either way the result is a new frame and the input isn't modified
+    if glucose_df['timestamp'].is_monotonic_increasing:
+        df = glucose_df.reset_index(drop=True)
+    else:
+        df = glucose_df.sort_values('timestamp').reset_index(drop=True)
+
+    # Calculate velocity (mg/dL per minute) straight from numpy arrays
+    # instead of materializing intermediate diff columns on the DataFrame
+    # (.values is datetime64 even for tz-aware columns, which keeps the diff in numpy)
+    time_diff_min = np.diff(df['timestamp'].values) / np.timedelta64(1, 'm')
+    glucose = df['glucose_mg_dl'].to_numpy(dtype=float)
+    velocity = np.full(len(df), np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        velocity[1:] = np.diff(glucose) / time_diff_min
+    df['velocity'] = velocity
 
     # Apply rolling average for smoothing
     window_size = max(1, window_minutes // 5)  # Assuming ~5 min intervals
@@ -37,12 +42,28 @@ def calculate_glucose_velocity(glucose_df: pd.DataFrame, window_minutes: int = 1
     # Mark danger zones (rapid drops)
     df['is_danger_zone'] = df['velocity_smoothed'] <= -DANGER_ZONE_THRESHOLD
 
-    # Clean up intermediate columns
-    df = df.drop(columns=['time_diff_min', 'glucose_diff'], errors='ignore')
-
     return df
 
 
+def downcast_glucose(glucose_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Shrink glucose numeric columns for storage in session state and upserts.
+
+    Readings become int16 when they are whole numbers (mg/dL exports always are);
+    velocity columns become float32.
+    """
+    glucose = glucose_df['glucose_mg_dl']
+    dtypes = {}
+    if glucose.between(0, np.iinfo(np.int16).max).all() and (glucose % 1 == 0).all():
+        dtypes['glucose_mg_dl'] = 'int16'
+    for col in ('velocity', 'velocity_smoothed'):
+        if col in glucose_df.columns:
+            dtypes[col] = 'float32'
+    if 'is_danger_zone' in glucose_df.columns:
+        dtypes['is_danger_zone'] = 'bool'
+    return glucose_df.astype(dtypes)
+
+
 def detect_crash_events(glucose_df: pd.DataFrame) -> list[dict]:
     """
     Detect crash events where glucose drops rapidly.
@@ -60,39 +81,46 @@ def detect_crash_events(glucose_df: pd.DataFrame) -> list[dict]:
     if 'velocity_smoothed' not in glucose_df.columns:
         glucose_df = calculate_glucose_velocity(glucose_df)
 
-    # Use vectorized approach to find contiguous blocks of danger zones
-    # A crash is a group of consecutive rows where is_danger_zone is True
-    danger_mask = glucose_df['is_danger_zone'].fillna(False)
-
-    # Identify where the danger zone status changes
-    # shift(1) compares current row with previous row
-    # cumsum() creates a unique ID for each contiguous block
-    group_ids = (danger_mask != danger_mask.shift()).cumsum()
-
-    # Filter for only danger zone blocks
-    danger_blocks = glucose_df[danger_mask].copy()
-    if danger_blocks.empty:
+    # A crash is a run of consecutive rows where is_danger_zone is True.
+    # Find run boundaries from the edges of the padded mask rather than grouping rows.
+    danger_mask = glucose_df['is_danger_zone'].fillna(False).to_numpy(dtype=bool)
+    edges = np.diff(np.concatenate(([False], danger_mask, [False])).astype(np.int8))
+    run_starts = np.flatnonzero(edges == 1)
+    run_ends = np.flatnonzero(edges == -1) - 1  # inclusive
+
+    # Only runs of at least two readings count as crashes
+    keep = run_ends > run_starts
+    run_starts, run_ends = run_starts[keep], run_ends[keep]
+    if len(run_starts) == 0:
         return []
 
-    danger_blocks['block_id'] = group_ids[danger_mask]
-
-    crashes = []
-    # Group by block_id and extract stats
-    for _, block in danger_blocks.groupby('block_id'):
-        if len(block) >= 2:
-            start_row = block.iloc[0]
-            end_row = block.iloc[-1]
-
-            crashes.append({
-                'start_time': start_row['timestamp'],
-                'end_time': end_row['timestamp'],
-                'start_glucose': start_row['glucose_mg_dl'],
-                'end_glucose': end_row['glucose_mg_dl'],
-                'drop_magnitude': start_row['glucose_mg_dl'] - end_row['glucose_mg_dl'],
-                'average_velocity': block['velocity_smoothed'].mean(),
-                'max_velocity': block['velocity_smoothed'].min(),  # Most negative
-                'duration_minutes': (end_row['timestamp'] - start_row['timestamp']).total_seconds() / 60
-            })
+    # Per-run reductions in one numpy call each; dicts are only built at the end
+    timestamps = glucose_df['timestamp']
+    glucose = glucose_df['glucose_mg_dl'].to_numpy()
+    velocity = glucose_df['velocity_smoothed'].to_numpy(dtype=float)
+    # reduceat over [start, end + 1) pairs; every other result is a run
+    bounds = np.column_stack((run_starts, run_ends + 1)).ravel()
+    padded = np.append(velocity, np.nan)  # end + 1 may point one past the last row
+    average_velocity = np.add.reduceat(padded, bounds)[::2] / (run_ends - run_starts + 1)
+    max_velocity = np.minimum.reduceat(padded, bounds)[::2]  # Most negative
+
+    start_times = timestamps.iloc[run_starts].reset_index(drop=True)
+    end_times = timestamps.iloc[run_ends].reset_index(drop=True)
+    duration_minutes = (end_times - start_times).dt.total_seconds().to_numpy() / 60
+
+    crashes = [
+        {
+            'start_time': start_time,
+            'end_time': end_time,
+            'start_glucose': glucose[start],
+            'end_glucose': glucose[end],
+            'drop_magnitude': glucose[start] - glucose[end],
+            'average_velocity': average_velocity[i],
+            'max_velocity': max_velocity[i],
+            'duration_minutes': duration_minutes[i]
+        }
+        for i, (start, end, start_time, end_time) in enumerate(zip(run_starts, run_ends, start_times, end_times))
+    ]
 
     return crashes
 
@@ -108,7 +136,7 @@ def analyze_meal_response(meal_event: dict) -> dict:
     - Crash severity (if any)
     - Recovery time
     """
-    glucose_readings = meal_event.get('glucose_readings', [])
+    glucose_readings = meal_event.get('glucose_readings', {})
     if not glucose_readings:
         return {}
 
@@ -176,6 +204,112 @@ def analyze_meal_response(meal_event: dict) -> dict:
     return analysis
 
 
+def analyze_meal_responses(meals_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Analyze the glucose response to every meal in a merged meals frame at once.
+
+    Vectorized equivalent of calling analyze_meal_response on each row: the
+    readings of all meals are stacked into one long table and the per-meal
+    peak, nadir and velocity extremes come from numpy reduceat calls.
+
+    Args:
+        meals_df: Output of merge_meals_with_glucose
+
+    Returns:
+        One row per meal that has glucose readings, indexed like meals_df, with
+        the analyze_meal_response keys as columns (crash_* columns are NaN for
+        meals without a crash)
+    """
+    lengths = np.array([
+        len(meal_readings.get('glucose_mg_dl', ())) if isinstance(meal_readings, dict) else 0
+        for meal_readings in meals_df['glucose_readings']
+    ], dtype=np.int64)
+    meals = meals_df[lengths > 0]
+    lengths = lengths[lengths > 0]
+    if meals.empty:
+        return pd.DataFrame()
+
+    # Every meal's readings come from the same glucose frame, so the first one shows which columns exist
+    meal_readings = meals['glucose_readings'].tolist()
+    if 'velocity_smoothed' not in meal_readings[0]:
+        # analyze_meal_response recomputes velocity per meal in this case
+        return pd.DataFrame([analyze_meal_response(meal) for meal in meals.to_dict('records')], index=meals.index)
+
+    # The readings are already column arrays, so stacking them is one concatenate per column
+    readings = pd.DataFrame({
+        col: np.concatenate([r[col] for r in meal_readings])
+        for col in ['timestamp', 'glucose_mg_dl', 'minutes_from_meal', 'velocity_smoothed', 'is_danger_zone']
+    })
+
+    # Position of every reading, the meal it belongs to and where each meal starts/ends
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    ends = starts + lengths
+    meal_of = np.repeat(np.arange(len(meals)), lengths)
+    pos = np.arange(len(readings))
+    glucose = readings['glucose_mg_dl'].to_numpy(dtype=float)
+    minutes = readings['minutes_from_meal'].to_numpy(dtype=float)
+    velocity = readings['velocity_smoothed'].to_numpy(dtype=float)
+
+    # Peak: first reading at the meal's max, like idxmax
+    peak_glucose = np.fmax.reduceat(glucose, starts)
+    peak_pos = np.minimum.reduceat(np.where(glucose == peak_glucose[meal_of], pos, len(pos)), starts)
+    baseline = glucose[starts]
+
+    # Velocity extremes up to and from the peak (both include the peak reading)
+    pre_peak = pos <= peak_pos[meal_of]
+    post_peak = pos >= peak_pos[meal_of]
+    max_rise_velocity = np.fmax.reduceat(np.where(pre_peak, velocity, np.nan), starts)
+    max_drop_velocity = np.fmin.reduceat(np.where(post_peak, velocity, np.nan), starts)
+
+    # Nadir: first reading at the post-peak minimum, like idxmin
+    nadir_glucose = np.fmin.reduceat(np.where(post_peak, glucose, np.nan), starts)
+    nadir_pos = np.minimum.reduceat(
+        np.where(post_peak & (glucose == nadir_glucose[meal_of]), pos, len(pos)), starts
+    )
+    has_drop = ends - peak_pos > 1
+
+    analysis = pd.DataFrame({
+        'baseline_glucose': baseline,
+        'peak_glucose': peak_glucose,
+        'min_glucose': np.fmin.reduceat(glucose, starts),
+        'glucose_rise': peak_glucose - baseline,
+        'time_to_peak_minutes': minutes[peak_pos],
+        'max_rise_velocity': max_rise_velocity,
+        'max_drop_velocity': max_drop_velocity,
+        'total_drop': np.where(has_drop, peak_glucose - nadir_glucose, 0),
+        'drop_duration_minutes': np.where(has_drop, minutes[nadir_pos] - minutes[peak_pos], 0),
+        'crash_detected': False,
+    }, index=meals.index)
+
+    # Crashes need two consecutive danger-zone readings after the peak, so only
+    # meals with at least two post-peak danger readings are checked in full
+    danger = readings['is_danger_zone'].fillna(False).to_numpy(dtype=bool)
+    danger_counts = np.add.reduceat((danger & post_peak).astype(np.int64), starts)
+    crash_columns = {'crash_start_minutes': [], 'crash_magnitude': [], 'crash_velocity': []}
+    crash_index = []
+    for i in np.flatnonzero(has_drop & (danger_counts >= 2)):
+        crashes = detect_crash_events(readings.iloc[peak_pos[i]:ends[i]])
+        if crashes:
+            worst_crash = max(crashes, key=lambda x: x['drop_magnitude'])
+            crash_index.append(meals.index[i])
+            crash_columns['crash_start_minutes'].append(
+                (worst_crash['start_time'] - readings['timestamp'].iloc[starts[i]]).total_seconds() / 60
+            )
+            crash_columns['crash_magnitude'].append(worst_crash['drop_magnitude'])
+            crash_columns['crash_velocity'].append(worst_crash['max_velocity'])
+    if crash_index:
+        analysis.loc[crash_index, 'crash_detected'] = True
+        analysis = analysis.join(pd.DataFrame(crash_columns, index=crash_index))
+
+    # Protein to carb ratio (inf when a meal has protein but no carbs)
+    carbs = meals['carbs_g'].to_numpy(dtype=float) if 'carbs_g' in meals.columns else np.zeros(len(meals))
+    protein = meals['protein_g'].to_numpy(dtype=float) if 'protein_g' in meals.columns else np.zeros(len(meals))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        analysis['protein_carb_ratio'] = np.where(carbs > 0, protein / carbs, np.where(protein > 0, np.inf, 0))
+
+    return analysis
+
+
 def get_crash_summary_stats(crash_events: list[dict]) -> dict:
     """Get summary statistics for crash events."""
     if not crash_events:
@@ -1,38 +1,61 @@
 """CSV parsing utilities for Libre CGM and Cronometer data."""
+import numpy as np
 import pandas as pd
 from datetime import datetime
 from io import StringIO
+from typing import IO
 
 
-def parse_libre_csv(file_content: str) -> pd.DataFrame:
+def _as_buffer(file_content: str | IO[bytes]) -> IO:
+    """Wrap string content in a buffer; binary file-likes are read by pandas directly."""
+    if isinstance(file_content, str):
+        return StringIO(file_content)
+    return file_content
+
+
+def _normalize(col: str) -> str:
+    """Normalize a CSV header to lowercase snake_case (e.g. 'Device Timestamp' -> 'device_timestamp')."""
+    return col.strip().lower().replace(' ', '_')
+
+
+def parse_libre_csv(file_content: str | IO[bytes]) -> pd.DataFrame:
     """
     Parse FreeStyle Libre CSV export.
 
+    Accepts the CSV as a string or a binary file-like (e.g. BytesIO), which
+    lets pandas decode and parse in one pass without an intermediate str copy.
+
     Libre exports typically have:
     - Device timestamp
     - Record Type (0=historic glucose, 1=scan, etc.)
     - Historic Glucose mg/dL
     """
     try:
-        # Libre CSVs often have header rows to skip
-        # Try to find the actual data start
-        lines = file_content.strip().split('\n')
+        buffer = _as_buffer(file_content)
 
+        # Libre CSVs often have header rows to skip
         # Find the header row (contains 'Device Timestamp' or similar)
         header_idx = 0
-        for i, line in enumerate(lines):
+        for i, line in enumerate(buffer):
+            if isinstance(line, bytes):
+                line = line.decode('utf-8', errors='ignore')
             if 'Device Timestamp' in line or 'Timestamp' in line:
                 header_idx = i
                 break
+        buffer.seek(0)
 
-        # Read the CSV starting from the header
+        # Read the CSV starting from the header, converting only the timestamp and
+        # glucose columns (Libre exports carry ~19 mostly-empty columns)
         df = pd.read_csv(
-            StringIO('\n'.join(lines[header_idx:])),
+            buffer,
+            skiprows=header_idx,
+            encoding='utf-8',
+            usecols=lambda col: 'timestamp' in _normalize(col) or 'glucose' in _normalize(col),
             parse_dates=True
         )
 
         # Normalize column names
-        df.columns = df.columns.str.strip().str.lower().str.replace(' ', '_')
+        df.columns = df.columns.map(_normalize)
 
         # Find timestamp and glucose columns
         timestamp_col = None
@@ -66,10 +89,12 @@ def parse_libre_csv(file_content: str) -> pd.DataFrame:
         raise ValueError(f"Error parsing Libre CSV: {e}")
 
 
-def parse_cronometer_csv(file_content: str) -> pd.DataFrame:
+def parse_cronometer_csv(file_content: str | IO[bytes]) -> pd.DataFrame:
     """
     Parse Cronometer CSV export.
 
+    Accepts the CSV as a string or a binary file-like (e.g. BytesIO).
+
     Cronometer exports typically have:
     - Day, Time columns
     - Group (meal grouping like "Breakfast", "Lunch", etc.)
@@ -77,7 +102,7 @@ def parse_cronometer_csv(file_content: str) -> pd.DataFrame:
     - Energy (kcal), Protein, Carbs, Fat, Fiber, Sugar, etc.
     """
     try:
-        df = pd.read_csv(StringIO(file_content))
+        df = pd.read_csv(_as_buffer(file_content), encoding='utf-8')
 
         # Normalize column names
         df.columns = df.columns.str.strip().str.lower().str.replace(' ', '_')
@@ -120,9 +145,9 @@ def parse_cronometer_csv(file_content: str) -> pd.DataFrame:
             'day': df['day'],
         }
 
-        # Preserve group column
+        # Preserve group column; a handful of names repeated on every row, so store it as a categorical
         if 'group' in df.columns:
-            result_data['group'] = df['group']
+            result_data['group'] = df['group'].astype('category')
         else:
             result_data['group'] = 'Uncategorized'
 
@@ -172,48 +197,54 @@ def group_foods_into_meals(food_df: pd.DataFrame) -> pd.DataFrame:
     if 'day' not in food_df.columns:
         food_df['day'] = food_df['timestamp'].dt.date
 
-    meals = []
+    # Group by day and group name; every food's meal number orders the per-meal lists
+    grouped = food_df.groupby(['day', 'group'], observed=True)
+    meal_ids = grouped.ngroup().to_numpy()
+    meal_keys = grouped.size()
+    if meal_keys.empty:
+        return pd.DataFrame()
 
-    # Group by day and group name
-    for (day, group), group_df in food_df.groupby(['day', 'group']):
-        # Get the earliest timestamp as meal time
-        meal_time = group_df['timestamp'].min()
+    # Aggregate macros for all meals at once
+    totals = grouped[['calories', 'protein_g', 'carbs_g', 'fat_g', 'fiber_g', 'sugar_g']].sum()
 
-        # Aggregate macros
-        total_calories = group_df['calories'].sum()
-        total_protein = group_df['protein_g'].sum()
-        total_carbs = group_df['carbs_g'].sum()
-        total_fat = group_df['fat_g'].sum()
-        total_fiber = group_df['fiber_g'].sum()
-        total_sugar = group_df['sugar_g'].sum()
+    food_counts = meal_keys.to_numpy()
+    ends = np.cumsum(food_counts).tolist()
+    starts = [0] + ends[:-1]
 
-        # List of foods in this meal (names only, for backward compatibility)
-        food_list = group_df['food_name'].tolist()
+    def split_by_meal(order: np.ndarray, values: list) -> list[list]:
+        # Foods without a day or group belong to no meal (ngroup gives -1)
+        values = [values[i] for i in order[meal_ids[order] >= 0]]
+        return [values[lo:hi] for lo, hi in zip(starts, ends)]
 
-        # List of foods with timestamps for display
-        foods_with_times = [
-            {'name': row['food_name'], 'timestamp': row['timestamp']}
-            for _, row in group_df.sort_values('timestamp').iterrows()
-        ]
+    names = food_df['food_name'].tolist()
+    timestamps = food_df['timestamp']
 
-        meals.append({
-            'day': day,
-            'group': group,
-            'meal_time': meal_time,
-            'foods': food_list,
-            'foods_with_times': foods_with_times,
-            'food_count': len(food_list),
-            'calories': total_calories,
-            'protein_g': total_protein,
-            'carbs_g': total_carbs,
-            'fat_g': total_fat,
-            'fiber_g': total_fiber,
-            'sugar_g': total_sugar,
-        })
+    # List of foods in this meal (names only, for backward compatibility)
+    food_lists = split_by_meal(np.argsort(meal_ids, kind='stable'), names)
 
-    result = pd.DataFrame(meals)
-    if result.empty:
-        return result
+    # List of foods with timestamps for display, in time order; the 12-hour display
+    # time is formatted for every food in one vectorized strftime
+    times = timestamps.dt.strftime('%I:%M %p').str.lstrip('0').tolist()
+    foods_with_times = split_by_meal(
+        np.lexsort((timestamps.to_numpy(dtype='datetime64[ns]'), meal_ids)),
+        [
+            {'name': name, 'timestamp': timestamp, 'time': time}
+            for name, timestamp, time in zip(names, timestamps.tolist(), times)
+        ]
+    )
+
+    result = pd.DataFrame({
+        'day': meal_keys.index.get_level_values('day'),
+        'group': meal_keys.index.get_level_values('group'),
+        # The earliest timestamp is the meal time
+        'meal_time': grouped['timestamp'].min().array,
+        'foods': food_lists,
+        'foods_with_times': foods_with_times,
+        'food_count': food_counts,
+        **{col: totals[col].to_numpy() for col in totals.columns},
+    })
+    # Keep the food logs' group dtype (categorical when parsed or loaded from the database)
+    result['group'] = result['group'].astype(food_df['group'].dtype)
     result = result.sort_values('meal_time').reset_index(drop=True)
     return result
 
@@ -229,6 +260,9 @@ def merge_meals_with_glucose(
     For each meal, find glucose readings within the tolerance window
     and in the hours following the meal. Includes meals with partial
     or no glucose data.
+
+    Each meal's glucose_readings maps column name to a numpy array of its
+    readings (an empty dict when there are none); timestamps are datetime64.
     """
     if meals_df.empty:
         return pd.DataFrame()
@@ -236,12 +270,13 @@ def merge_meals_with_glucose(
     if glucose_df.empty:
         # Return meals with no glucose data
         merged_events = []
-        for _, meal_row in meals_df.iterrows():
+        for meal_row in meals_df.to_dict('records'):
             merged_events.append({
                 'day': meal_row['day'],
                 'group': meal_row['group'],
                 'meal_time': meal_row['meal_time'],
                 'foods': meal_row['foods'],
+                'foods_with_times': meal_row.get('foods_with_times', []),
                 'food_count': meal_row['food_count'],
                 'calories': meal_row.get('calories', 0),
                 'protein_g': meal_row.get('protein_g', 0),
@@ -249,7 +284,7 @@ def merge_meals_with_glucose(
                 'fat_g': meal_row.get('fat_g', 0),
                 'fiber_g': meal_row.get('fiber_g', 0),
                 'sugar_g': meal_row.get('sugar_g', 0),
-                'glucose_readings': [],
+                'glucose_readings': {},
                 'peak_glucose': None,
                 'min_glucose': None,
                 'baseline_glucose': None,
@@ -257,16 +292,22 @@ def merge_meals_with_glucose(
                 'data_complete': False,
                 'minutes_until_complete': None,
             })
-        return pd.DataFrame(merged_events)
+        result = pd.DataFrame(merged_events)
+        result['group'] = result['group'].astype(meals_df['group'].dtype)
+        return result
 
     import numpy as np
 
     # Ensure glucose is sorted for efficient searching
     glucose_df = glucose_df.sort_values('timestamp')
     latest_glucose_time = glucose_df['timestamp'].max()
+    # Stored reading times are datetime64 (UTC for tz-aware database times): to_numpy()
+    # on a tz-aware column would give an object array of Timestamps
+    timestamp_values = glucose_df['timestamp'].values
 
     merged_events = []
-    for _, meal_row in meals_df.iterrows():
+    # Plain dict rows: every meal_row lookup below is a dict lookup, not a Series __getitem__
+    for meal_row in meals_df.to_dict('records'):
         meal_time = meal_row['meal_time']
         meal_start_search = meal_time - pd.Timedelta(minutes=tolerance_minutes)
         meal_end_time = meal_time + pd.Timedelta(hours=3)
@@ -312,7 +353,10 @@ def merge_meals_with_glucose(
             'fat_g': meal_row.get('fat_g', 0),
             'fiber_g': meal_row.get('fiber_g', 0),
             'sugar_g': meal_row.get('sugar_g', 0),
-            'glucose_readings': related_glucose.to_dict('records') if not related_glucose.empty else [],
+            'glucose_readings': {
+                col: timestamp_values[start_idx:end_idx] if col == 'timestamp' else related_glucose[col].to_numpy()
+                for col in related_glucose.columns
+            } if not related_glucose.empty else {},
             'peak_glucose': related_glucose['glucose_mg_dl'].max() if not related_glucose.empty else None,
             'min_glucose': related_glucose['glucose_mg_dl'].min() if not related_glucose.empty else None,
             'baseline_glucose': related_glucose['glucose_mg_dl'].iloc[0] if not related_glucose.empty else None,
@@ -321,4 +365,6 @@ def merge_meals_with_glucose(
             'minutes_until_complete': minutes_until_complete,
         })
 
-    return pd.DataFrame(merged_events)
+    result = pd.DataFrame(merged_events)
+    result['group'] = result['group'].astype(meals_df['group'].dtype)
+    return result
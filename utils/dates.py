@@ -0,0 +1,11 @@
+"""Date helpers shared by the pages' date-range filters."""
+import numpy as np
+import pandas as pd
+
+
+def day_numbers(timestamps: pd.Series) -> np.ndarray:
+    """Calendar day of each timestamp as an int64 day count, for cheap date-range masks."""
+    if timestamps.dt.tz is not None:
+        # Keep the wall-clock date, matching what .dt.date would return
+        timestamps = timestamps.dt.tz_localize(None)
+    return timestamps.to_numpy().astype('datetime64[D]').view('i8')
@@ -0,0 +1,105 @@
+"""Downsampling helpers for keeping chart traces within a fixed point budget."""
+import numpy as np
+
+
+def lttb_downsample(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Pick the points to keep from a series with Largest-Triangle-Three-Buckets.
+
+    Unlike a mean resample, LTTB keeps local peaks and troughs, so rapid drops
+    stay visible on the chart.
+
+    Args:
+        x: Monotonic x values (e.g. seconds since the first reading)
+        y: Values to preserve the shape of; must not contain NaN
+        n_out: Number of points to keep
+
+    Returns:
+        Sorted integer indices into x/y, always including the first and last point
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    # The first and last points are fixed; the rest are split into n_out - 2 buckets
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+
+    # Third triangle vertex for each bucket: the average of the next bucket (or the
+    # last point), computed for every bucket at once instead of inside the loop
+    sizes = np.diff(edges)
+    next_x = np.append(np.add.reduceat(x[:edges[-1]], edges[:-1])[1:] / sizes[1:], x[-1]).tolist()
+    next_y = np.append(np.add.reduceat(y[:edges[-1]], edges[:-1])[1:] / sizes[1:], y[-1]).tolist()
+    bounds = edges.tolist()
+
+    prev_x, prev_y = x[0], y[0]
+    for i in range(n_out - 2):
+        start, end = bounds[i], bounds[i + 1]
+        area = np.abs(
+            (prev_x - next_x[i]) * (y[start:end] - prev_y)
+            - (prev_x - x[start:end]) * (next_y[i] - prev_y)
+        )
+        prev = start + int(area.argmax())
+        selected[i + 1] = prev
+        prev_x, prev_y = x[prev], y[prev]
+
+    return selected
+
+
+def minmax_lttb_downsample(x: np.ndarray, y: np.ndarray, n_out: int, minmax_ratio: int = 4) -> np.ndarray:
+    """
+    Pick the points to keep with MinMaxLTTB: LTTB run over per-bucket extremes.
+
+    Each of n_out * minmax_ratio / 2 equal-count buckets contributes its minimum
+    and maximum, so every excursion survives into the LTTB pass, which then only
+    scans those candidates instead of every point. Uses tsdownsample's
+    implementation when it is installed.
+
+    Args:
+        x: Monotonic x values (e.g. seconds since the first reading)
+        y: Values to preserve the shape of; must not contain NaN
+        n_out: Number of points to keep
+        minmax_ratio: Candidates kept per output point by the min/max pass
+
+    Returns:
+        Sorted integer indices into x/y, always including the first and last point
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    try:
+        from tsdownsample import MinMaxLTTBDownsampler
+    except ImportError:
+        MinMaxLTTBDownsampler = None
+    if MinMaxLTTBDownsampler is not None:
+        return MinMaxLTTBDownsampler().downsample(
+            np.asarray(x, dtype=float), np.asarray(y, dtype=float), n_out=n_out, minmax_ratio=minmax_ratio
+        ).astype(np.int64)
+
+    n_buckets = n_out * minmax_ratio // 2
+    if n - 2 <= 2 * n_buckets:
+        return lttb_downsample(x, y, n_out)
+
+    y = np.asarray(y, dtype=float)
+    # Interior points split into equal-count buckets; the first and last points stay fixed
+    starts = np.linspace(1, n - 1, n_buckets + 1).astype(np.int64)[:-1]
+    bucket = np.repeat(np.arange(n_buckets), np.diff(np.append(starts, n - 1)))
+    interior = y[1:-1]
+
+    def first_match(extremes: np.ndarray) -> np.ndarray:
+        # Position of the first point in each bucket equal to that bucket's extreme
+        hits = np.flatnonzero(interior == extremes[bucket])
+        return hits[np.unique(bucket[hits], return_index=True)[1]] + 1
+
+    candidates = np.unique(np.concatenate((
+        [0, n - 1],
+        first_match(np.minimum.reduceat(interior, starts - 1)),
+        first_match(np.maximum.reduceat(interior, starts - 1)),
+    )))
+    return candidates[lttb_downsample(np.asarray(x, dtype=float)[candidates], y[candidates], n_out)]
@@ -0,0 +1,45 @@
+"""Shape analyzed upload data into the rows saved to each Supabase table."""
+import pandas as pd
+
+# Columns saved to each Supabase table
+GLUCOSE_SCHEMA_COLS = ('timestamp', 'glucose_mg_dl', 'velocity', 'velocity_smoothed', 'is_danger_zone')
+FOOD_SCHEMA_COLS = ('timestamp', 'food_name', 'group', 'calories', 'protein_g', 'carbs_g', 'fat_g', 'fiber_g', 'sugar_g')
+CRASH_SCHEMA_COLS = ('start_time', 'end_time', 'start_glucose', 'end_glucose', 'drop_magnitude', 'average_velocity', 'max_velocity', 'duration_minutes')
+
+# NaN is left as-is in every payload, the client's orjson encoder writes it as null
+
+
+def glucose_save_records(glucose_df: pd.DataFrame) -> list[dict]:
+    """glucose_readings rows: schema columns only, with ISO timestamp strings for JSON."""
+    glucose_cols = [c for c in GLUCOSE_SCHEMA_COLS if c in glucose_df.columns]
+    glucose_clean = glucose_df[glucose_cols].copy()
+    glucose_clean['timestamp'] = glucose_clean['timestamp'].dt.strftime('%Y-%m-%dT%H:%M:%S')
+    # Analyzed frames hold float32 velocities, which to_dict widens to long float64
+    # reprs (-0.2083333283662796); the saved velocities are rounded to 4 decimals instead
+    velocity_cols = [c for c in ('velocity', 'velocity_smoothed') if c in glucose_clean.columns]
+    glucose_clean[velocity_cols] = glucose_clean[velocity_cols].astype('float64').round(4)
+    return glucose_clean.to_dict('records')
+
+
+def food_save_frame(food_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    food_logs rows as a DataFrame, which save_food_logs accepts directly.
+
+    Keeps the schema columns, renames 'group' to 'meal_group' (group is a
+    reserved word) and formats timestamps as ISO strings.
+    """
+    food_cols = [c for c in FOOD_SCHEMA_COLS if c in food_df.columns]
+    food_clean = food_df[food_cols].rename(columns={'group': 'meal_group'})
+    food_clean['timestamp'] = food_clean['timestamp'].dt.strftime('%Y-%m-%dT%H:%M:%S')
+    return food_clean
+
+
+def crash_save_records(crash_events: list[dict]) -> list[dict]:
+    """crash_events rows: schema columns only, start/end times as ISO strings in one pass."""
+    if not crash_events:
+        return []
+    crash_df = pd.DataFrame(crash_events)
+    crash_clean = crash_df[[c for c in CRASH_SCHEMA_COLS if c in crash_df.columns]].copy()
+    for key in ['start_time', 'end_time']:
+        crash_clean[key] = crash_clean[key].dt.strftime('%Y-%m-%dT%H:%M:%S')
+    return crash_clean.to_dict('records')